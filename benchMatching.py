@@ -0,0 +1,150 @@
+"""Benchmarks throughput, memory use and per stage precision/recall of club and player name matching on synthetic rosters
+
+Usage: python benchMatching.py [--scales 1x1 1x20 5x20 50x20] [--players 25] [--memory] [--json results.json]
+
+A scale is <leagues>x<clubs per league>. Each matcher runs its synchronous stages in the same order as its main();
+wiki_name_match is left out since it queries Wikipedia. A stage's precision is the share of its new site matches
+linking the same true player or club, and recall is the cumulative share of linkable site matches found so far.
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+import pandas as pd
+from nameMatches import ClubMatchesBySite, PlayerMatchesBySite
+from dfTransforms import PipeBase, LoadDataFrames, FormatNames, SplitBySite, ClubNameMatches, ClubPartitions
+from syntheticRosters import RosterGenerator
+
+club_stages = ['same_name', 'fuzzy_match', 'partial_match', 'second_fuzzy_match']
+player_stages = ['same_name', 'fuzzy_match', 'common_lastname']
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Benchmark club and player name matching on synthetic rosters')
+    parser.add_argument('--scales', nargs='+', default=['1x1', '1x20', '5x20', '20x20', '50x20'], help='<leagues>x<clubs per league> roster sizes to benchmark')
+    parser.add_argument('--players', type=int, default=25, help='players per club')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--memory', action='store_true', help='rerun each scale under tracemalloc to report peak memory')
+    parser.add_argument('--json', help='also write results to this JSON file')
+    return parser.parse_args()
+
+def new_stats(stages: list[str]) -> dict:
+    return {stage: {'rows': 0, 'seconds': 0.0, 'hits': 0, 'correct': 0} for stage in stages}
+
+def run_matcher(matcher, primary: str, stages: list[str], keys, stats: dict) -> int:
+    """Runs a matcher's stages, adding each stage's time, new matches and correct new matches to stats
+
+    Keyword arguments:
+    primary -- match row key holding the name every site is matched to
+    keys -- function of (match row key, name) returning the set of true keys the name belongs to
+
+    Returns the number of (primary name, site) pairs that have a true match in the matcher's site names
+    """
+    rows = list(matcher.match_rows)
+    site_keys = {site: set().union(*(keys(site, name) for name in names)) for site, names in matcher.sites_to_match.items()}
+    linkable = sum(bool(keys(primary, row[primary]) & site_keys[site]) for row in rows for site in matcher.site_names)
+    seen = set()
+    for stage in stages:
+        if not matcher.match_rows:
+            break
+        stats[stage]['rows'] += len(matcher.match_rows)
+        start = time.perf_counter()
+        matcher.match_stage_sync(getattr(matcher, stage))
+        stats[stage]['seconds'] += time.perf_counter() - start
+        for i, row in enumerate(rows):
+            for site in matcher.site_names:
+                if row[site] is not None and (i, site) not in seen:
+                    seen.add((i, site))
+                    stats[stage]['hits'] += 1
+                    stats[stage]['correct'] += bool(keys(primary, row[primary]) & keys(site, row[site]))
+    return linkable
+
+def name_keys(df: pd.DataFrame, truth: pd.DataFrame, group_cols: list[str]) -> dict:
+    """Maps (site, *group_cols) to the set of true keys of the rows sharing those values"""
+    keyed = df.merge(truth, on=['site', 'id'])
+    return {group: set(group_df.key) for group, group_df in keyed.groupby(['site', *group_cols])}
+
+def match_clubs(truth: pd.DataFrame, stats: dict) -> int:
+    """Matches club names across sites, returning the number of linkable club pairs"""
+    club_keys = name_keys(pd.concat(PipeBase.site_dfs_clubs), truth, ['name'])
+    club_names_by_site = [df['name'].values for df in PipeBase.site_dfs_clubs]
+    matcher = ClubMatchesBySite(club_names_by_site)
+    # ClubMatchesBySite pairs its site labels with every site's names except sofascore's, in PipeBase.sites order
+    label_sites = {**dict(zip(matcher.site_names, [site for i, site in enumerate(PipeBase.sites) if i != 1])), 'sofascore': 'sofascore'}
+    keys = lambda label, name: club_keys.get((label_sites[label], name), set())
+    linkable = run_matcher(matcher, 'sofascore', club_stages, keys, stats)
+    ClubNameMatches().run(pd.DataFrame(matcher.full_matches))
+    return linkable
+
+def match_players(truth: pd.DataFrame, stats: dict) -> int:
+    """Matches player names across sites club by club, returning the number of linkable player pairs"""
+    player_keys = name_keys(pd.concat(PipeBase.site_dfs), truth, ['team', 'processedName'])
+    partitions = ClubPartitions(PipeBase.site_dfs)
+    linkable = 0
+    for team in PipeBase.club_match_df.sofascore.unique():
+        players = partitions.club(team)
+        matcher = PlayerMatchesBySite(players, team, None)
+        label_sites = {**dict(zip(matcher.site_names, PipeBase.sites)), 'fotmob': 'fotmob'}
+        keys = lambda label, name: player_keys.get((label_sites[label], team, name), set())
+        linkable += run_matcher(matcher, 'fotmob', player_stages, keys, stats)
+    return linkable
+
+def run_scale(leagues: int, clubs: int, players: int, seed: int) -> dict:
+    """Generates rosters at one scale and matches clubs then players"""
+    club_df, player_df, truth = RosterGenerator(leagues, clubs, players, seed).generate()
+    PipeBase.team_match_map = {}
+    PipeBase.player_match_map = {}
+    LoadDataFrames().load_dfs(player_df, club_df)
+    FormatNames().run()
+    SplitBySite().run()
+    result = {'club_rows': len(club_df), 'player_rows': len(player_df)}
+    for entity, stages, match in (('club', club_stages, match_clubs), ('player', player_stages, match_players)):
+        stats = new_stats(stages)
+        linkable = match(truth, stats)
+        found = 0
+        for stage in stages:
+            stage_stats = stats[stage]
+            found += stage_stats['correct']
+            stage_stats['rows_per_second'] = stage_stats['rows'] / stage_stats['seconds'] if stage_stats['seconds'] else None
+            stage_stats['precision'] = stage_stats['correct'] / stage_stats['hits'] if stage_stats['hits'] else None
+            stage_stats['recall'] = found / linkable if linkable else None
+        result[entity] = {'linkable': linkable, 'seconds': sum(s['seconds'] for s in stats.values()), 'stages': stats}
+    return result
+
+def peak_memory(leagues: int, clubs: int, players: int, seed: int) -> int:
+    """Reruns a scale under tracemalloc and returns its peak traced memory in bytes"""
+    tracemalloc.start()
+    try:
+        run_scale(leagues, clubs, players, seed)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def format_ratio(value) -> str:
+    return '-' if value is None else f'{value:.3f}'
+
+def print_result(scale: str, result: dict) -> None:
+    print(f"\n== {scale}: {result['club_rows']} club rows, {result['player_rows']} player rows ==")
+    if 'peak_memory' in result:
+        print(f"peak traced memory: {result['peak_memory'] / 2 ** 20:.1f}MiB")
+    print(f"{'entity':<8}{'stage':<20}{'rows':>8}{'seconds':>10}{'rows/s':>12}{'hits':>8}{'precision':>11}{'recall':>8}")
+    for entity in ('club', 'player'):
+        for stage, s in result[entity]['stages'].items():
+            rows_per_second = '-' if s['rows_per_second'] is None else f"{s['rows_per_second']:.0f}"
+            print(f"{entity:<8}{stage:<20}{s['rows']:>8}{s['seconds']:>10.3f}{rows_per_second:>12}{s['hits']:>8}"
+                  f"{format_ratio(s['precision']):>11}{format_ratio(s['recall']):>8}")
+
+def main(args: argparse.Namespace) -> None:
+    results = {}
+    for scale in args.scales:
+        leagues, clubs = map(int, scale.split('x'))
+        results[scale] = run_scale(leagues, clubs, args.players, args.seed)
+        if args.memory:
+            results[scale]['peak_memory'] = peak_memory(leagues, clubs, args.players, args.seed)
+        print_result(scale, results[scale])
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main(parse_args())
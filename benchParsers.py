@@ -0,0 +1,164 @@
+"""Checks and benchmarks every site parser offline against the captured responses in fixtures/<site>/
+
+Usage:
+python benchParsers.py --check   -- parse each fixture once and compare with its pinned <fixture>.expected.json (exits 1 on a mismatch)
+python benchParsers.py --update  -- re-pin the expected outputs after an intended parser or fixture change
+python benchParsers.py           -- report records per second and peak allocation per page for each parser,
+                                    then decodes per second and peak allocation per JSON response for each decoder
+
+JSON fixtures are decoded with --decoder before timing, since the scrapers decode responses outside of the parse span.
+Checking with --decoder stream verifies that each site's JSON projection keeps every field its parsers read.
+The raw pages of fbref's and understat's http fast path (<fixture>.page.html) are checked against the pinned
+output of their browser path, regardless of record order.
+"""
+
+import argparse
+import json
+import pathlib
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict
+from sites import Sofa, FotMob, Tm, Soccerment, Fbref, Under, Cap, Who
+from idObjects import ClubData
+from jsonDecoders import decoders
+
+here = pathlib.Path(__file__).parent / 'fixtures'
+
+sofa_club = ClubData('Manchester City', 17, 'Premier League 21/22', 'https://www.sofascore.com/team/football/manchester-city/17', 'sofascore')
+fotmob_club = ClubData('Manchester City', 8456, 'League N/A', 'https://www.fotmob.com/teams/8456/overview/manchester-city', 'fotmob')
+tm_club = ClubData('Manchester City', '281', 'League N/A', 'https://www.transfermarkt.us/manchester-city/spielplan/verein/281/saison_id/2021', 'transfermarkt')
+soccerment_club = ClubData('Manchester City', 'Club ID N/A', 'League N/A', 'https://analytics.soccerment.com/en/team/manchester_city/8456', 'soccerment')
+fbref_club = ClubData('Manchester City', 'b8fd03ef', 'League N/A', 'https://www.fbref.com/en/squads/b8fd03ef/Manchester-City-Stats', 'fbref')
+under_club = ClubData('Manchester City', 'Manchester_City', 'League N/A', 'https://www.understat.com/team/Manchester_City/2021', 'understat')
+who_club = ClubData('Man City', '167', 'Premier League', 'https://www.whoscored.com/Teams/167/Show/England-Manchester-City', 'whoscored')
+
+parser_cases = [ # site, parser, fixture file, arguments after the response
+    (Sofa(), 'process_club_json', 'clubs.json', ()),
+    (Sofa(), 'process_player_json', 'players.json', (sofa_club,)),
+    (FotMob(), 'process_club_json', 'clubs.json', ()),
+    (FotMob(), 'process_player_json', 'players.json', (fotmob_club,)),
+    (Tm(), 'process_club_html', 'clubs.html', ()),
+    (Tm(), 'process_player_html', 'players.html', (tm_club,)),
+    (Soccerment(), 'process_club_html', 'clubs.html', ()),
+    (Soccerment(), 'process_player_html', 'players.html', (soccerment_club,)),
+    (Fbref(), 'process_club_table', 'clubs.html', ()),
+    (Fbref(), 'process_player_table', 'players.html', ('Manchester City',)),
+    (Fbref(), 'process_club_html', 'clubs.page.html', ()),
+    (Fbref(), 'process_player_html', 'players.page.html', (fbref_club,)),
+    (Under(), 'process_club_table', 'clubs.html', ()),
+    (Under(), 'process_player_table', 'players.html', ('Manchester City',)),
+    (Under(), 'process_club_html', 'clubs.page.html', ()),
+    (Under(), 'process_player_html', 'players.page.html', (under_club,)),
+    (Cap(), 'process_club_table', 'clubs.html', ()),
+    (Cap(), 'process_player_table', 'players.html', ()),
+    (Who(), 'process_club_table', 'clubs.html', (Who.leagues['Premier League'],)),
+    (Who(), 'process_player_json', 'players.json', (who_club,)),
+]
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Check and benchmark site parsers against captured fixtures')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--check', action='store_true', help='compare parser output with the pinned expected output')
+    mode.add_argument('--update', action='store_true', help='pin the current parser output as expected')
+    parser.add_argument('--decoder', choices=list(decoders), default='fast', help='JSON decoder fixtures are decoded with')
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds to repeat each parser for when benchmarking')
+    return parser.parse_args()
+
+def fixture_path(site, fixture: str) -> pathlib.Path:
+    return here / site.name / fixture
+
+def browser_fixture(fixture: str) -> str:
+    """Gets the fixture of the browser path a raw page fixture must match, None for other fixtures"""
+    return fixture.replace('.page', '') if '.page.' in fixture else None
+
+def expected_path(site, fixture: str) -> pathlib.Path:
+    path = fixture_path(site, browser_fixture(fixture) or fixture)
+    return path.with_name(path.stem + '.expected.json')
+
+def projection(site, parser: str):
+    return getattr(site, 'club_projection' if 'club' in parser else 'player_projection', None)
+
+def load_response(site, parser: str, fixture: str, decoder):
+    """Reads a fixture the way its scraper hands the response to the parser"""
+    if fixture.endswith('.json'):
+        return decoder.decode(fixture_path(site, fixture).read_bytes(), projection(site, parser))
+    return fixture_path(site, fixture).read_text(encoding='utf-8')
+
+def parse(site, parser: str, response, args: tuple) -> list:
+    return getattr(site, parser)(response, *args)
+
+def check(decoder, update: bool = False) -> int:
+    """Compares (or with update, pins) each parser's records, returning the number of mismatches"""
+    mismatches = 0
+    for site, parser, fixture, args in parser_cases:
+        records = [asdict(record) for record in parse(site, parser, load_response(site, parser, fixture, decoder), args)]
+        path = expected_path(site, fixture)
+        if update and browser_fixture(fixture):
+            continue # pinned by the browser path's fixture
+        if update:
+            path.write_text(json.dumps(records, indent=2, ensure_ascii=False) + '\n', encoding='utf-8')
+            print(f'pinned {len(records)} records -- {site.name}.{parser}')
+            continue
+        expected = json.loads(path.read_text(encoding='utf-8'))
+        if browser_fixture(fixture):
+            records, expected = (sorted(r, key=lambda record: json.dumps(record, sort_keys=True)) for r in (records, expected))
+        if records == expected:
+            print(f'ok       {site.name}.{parser} ({len(records)} records)')
+            continue
+        mismatches += 1
+        print(f'MISMATCH {site.name}.{parser}')
+        for i in range(max(len(records), len(expected))):
+            got = records[i] if i < len(records) else None
+            want = expected[i] if i < len(expected) else None
+            if got != want:
+                print(f'  record {i}: expected {want}, got {got}')
+    return mismatches
+
+def repeat(func, min_time: float) -> tuple[float, int]:
+    """Calls func for at least min_time seconds, returning calls per second and the peak allocation of one call"""
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < min_time:
+        func()
+        calls += 1
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return calls / elapsed, peak
+
+def bench(decoder, min_time: float) -> None:
+    """Times each parser over repeated parses of its fixture and traces the peak allocation of a single parse"""
+    print(f"{'parser':<40}{'records':>8}{'parses/s':>12}{'records/s':>12}{'peak KiB/page':>15}")
+    for site, parser, fixture, args in parser_cases:
+        response = load_response(site, parser, fixture, decoder)
+        records = len(parse(site, parser, response, args))
+        rate, peak = repeat(lambda: parse(site, parser, response, args), min_time)
+        print(f'{site.name + "." + parser:<40}{records:>8}{rate:>12.0f}{records * rate:>12.0f}{peak / 1024:>15.1f}')
+
+def bench_decoders(min_time: float) -> None:
+    """Times each decoder over the JSON fixtures, with the site's projection for the projecting decoder"""
+    print(f"\n{'response':<40}{'decoder':>8}{'decodes/s':>12}{'MB/s':>12}{'peak KiB/page':>15}")
+    for site, parser, fixture, args in parser_cases:
+        if not fixture.endswith('.json'):
+            continue
+        body = fixture_path(site, fixture).read_bytes()
+        for decoder in (decoder_class() for decoder_class in decoders.values()):
+            rate, peak = repeat(lambda: decoder.decode(body, projection(site, parser)), min_time)
+            print(f'{site.name + "/" + fixture:<40}{decoder.name:>8}{rate:>12.0f}{rate * len(body) / 1e6:>12.1f}{peak / 1024:>15.1f}')
+
+def main(args: argparse.Namespace) -> None:
+    decoder = decoders[args.decoder]()
+    if args.check or args.update:
+        mismatches = check(decoder, args.update)
+        if mismatches:
+            print(f'{mismatches} parsers no longer match their pinned output')
+            sys.exit(1)
+    else:
+        bench(decoder, args.min_time)
+        bench_decoders(args.min_time)
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,54 @@
+"""Resolves the build ID Next.js sites put in their data URLs, which changes whenever the site is redeployed"""
+
+import asyncio
+import time
+from aiohttp import ClientSession
+from metrics import metrics
+
+class BuildIdResolver:
+    """Finds a site's build ID from a single page fetch and keeps it on site.build_id until it expires
+    or a request made with it 404s
+
+    Refreshes are coalesced: however many requests 404 with the same stale ID, the page is fetched once
+    and every request retries with the new ID. A refresh within min_interval seconds of the last one is skipped,
+    so a squad URL that 404s with a current ID doesn't refetch the page on every retry. The page is fetched
+    on the session directly, outside the crawl scheduler's host caps and the hedger.
+
+    The site needs:
+    build_id -- current build ID, None until resolved
+    build_id_page -- URL of a page embedding the build ID
+    build_id_pat -- regex whose first group is the build ID
+    """
+    def __init__(self, site, session: ClientSession, ttl: float = 6 * 3600, min_interval: float = 10) -> None:
+        self.site = site
+        self.session = session
+        self.ttl = ttl
+        self.min_interval = min_interval
+        self.expires = 0
+        self.refreshed_at = None
+        self.lock = asyncio.Lock()
+
+    async def resolve(self) -> str:
+        if self.site.build_id is None or time.monotonic() >= self.expires:
+            await self.refresh(self.site.build_id)
+        return self.site.build_id
+
+    async def refresh(self, stale_id: str) -> None:
+        """Fetches the build ID again unless another request already replaced stale_id or it was just fetched"""
+        async with self.lock:
+            if self.site.build_id != stale_id and time.monotonic() < self.expires:
+                return
+            if self.site.build_id is not None and self.refreshed_at is not None and time.monotonic() - self.refreshed_at < self.min_interval:
+                return
+            with metrics.span('request', site=self.site.name, kind='build_id'):
+                async with self.session.get(self.site.build_id_page, headers=self.site.headers) as r:
+                    metrics.inc('responses', site=self.site.name, status=r.status)
+                    r.raise_for_status()
+                    page_html = await r.text()
+            match = self.site.build_id_pat.search(page_html)
+            if match is None:
+                raise ValueError(f'no build ID found on {self.site.build_id_page}')
+            self.site.build_id = match.group(1)
+            self.refreshed_at = time.monotonic()
+            self.expires = self.refreshed_at + self.ttl
+            metrics.inc('build_id_refreshes', site=self.site.name)
@@ -0,0 +1,56 @@
+"""Parquet snapshots of the dataframes at each pipeline stage boundary so runs can resume from a saved stage"""
+
+import pathlib
+import pandas as pd
+
+class Checkpoints:
+    """Writes and reads typed Parquet snapshots of pipeline stage results
+
+    Stages (in pipeline order):
+    extract -- all_clubs_df, all_players_df scraped from every site
+    club_names -- club name matches across sites (ClubNameMatches)
+    player_names -- player name matches across sites (PlayerNameMatches)
+    matches -- final player_match_df, club_match_df
+    """
+    stages = {
+        'extract': ['all_clubs_df', 'all_players_df'],
+        'club_names': ['club_names_df'],
+        'player_names': ['player_name_matches_df'],
+        'matches': ['player_match_df', 'club_match_df'],
+    }
+
+    def __init__(self, path: pathlib.Path, resume_from: str = None) -> None:
+        """Creates the checkpoint directory and validates the stage to resume from"""
+        if resume_from is not None and resume_from not in self.stages:
+            raise ValueError(f'Unknown checkpoint {resume_from}, expected one of {list(self.stages)}')
+        self.path = pathlib.Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.resume_from = resume_from
+
+    def resumes(self, stage: str) -> bool:
+        """Determines if a stage's result should be read from its checkpoint instead of recomputed"""
+        if self.resume_from is None:
+            return False
+        stage_order = list(self.stages)
+        return stage_order.index(stage) <= stage_order.index(self.resume_from)
+
+    def file_path(self, name: str) -> pathlib.Path:
+        return self.path / f'{name}.parquet'
+
+    def typed(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Casts object columns to strings, as scraped ID columns mix ints and strings across sites"""
+        return df.astype({col: 'string' for col in df.columns if df[col].dtype == object})
+
+    def save(self, stage: str, *dfs: pd.DataFrame) -> None:
+        """Writes each dataframe of a stage, skipping stages that were themselves read from a checkpoint"""
+        if self.resumes(stage):
+            return
+        for name, df in zip(self.stages[stage], dfs):
+            self.typed(df).to_parquet(self.file_path(name))
+
+    def load(self, stage: str) -> list[pd.DataFrame]:
+        """Reads every dataframe of a stage"""
+        missing = [name for name in self.stages[stage] if not self.file_path(name).exists()]
+        if missing:
+            raise FileNotFoundError(f'No {stage} checkpoint in {self.path} (missing {missing})')
+        return [pd.read_parquet(self.file_path(name)) for name in self.stages[stage]]
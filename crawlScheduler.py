@@ -0,0 +1,221 @@
+"""Crawl configuration and the scheduler that runs scraping units under concurrency caps and a time budget"""
+
+import asyncio
+import heapq
+import itertools
+import pathlib
+import time
+import tomllib
+import pandas as pd
+from collections import defaultdict
+from dataclasses import dataclass, field
+from urllib.parse import urlparse
+from progressJournal import ProgressJournal
+from hedging import HedgedRequests
+from metrics import metrics
+
+@dataclass
+class CrawlConfig:
+    """Leagues, seasons and limits of a crawl
+
+    Keyword arguments:
+    concurrency -- units in flight across all sites
+    host_concurrency -- default units in flight per host
+    hosts -- per host overrides of host_concurrency
+    budget_seconds -- wall-clock budget after which units are no longer started and running units are cut off
+    leagues -- per site {unit name: league value passed to the site's get_league_url}, None keeps the site defaults
+    latest_leagues -- leagues restricted to the newest season of each league, crawled by sites whose squads ignore the season
+    priorities -- per unit name, lower runs first
+    seasons -- number of seasons crawled
+    hedging -- keyword arguments of hedging.HedgedRequests, its defaults when empty
+    """
+    concurrency: int = 8
+    host_concurrency: int = 1
+    hosts: dict = field(default_factory=dict)
+    budget_seconds: float = None
+    leagues: dict = None
+    latest_leagues: dict = None
+    priorities: dict = field(default_factory=dict)
+    seasons: int = 1
+    hedging: dict = field(default_factory=dict)
+
+def config_value(value):
+    return tuple(value) if isinstance(value, list) else value
+
+def load_config(path: pathlib.Path) -> CrawlConfig:
+    """Reads a TOML crawl config, see crawl.toml for the layout
+
+    Each league and season becomes a unit named '<league> <season>', and seasons are listed newest first
+    so the most recent copy of a club or player is kept when seasons overlap. The newest season each site
+    lists for a league is also kept in latest_leagues.
+    """
+    with open(path, 'rb') as f:
+        raw = tomllib.load(f)
+    crawl = raw.get('crawl', {})
+    leagues = {}
+    latest_leagues = {}
+    priorities = {}
+    seasons = set()
+    for league_name, league in raw.get('leagues', {}).items():
+        latest_sites = set()
+        for season, site_values in sorted(league.get('seasons', {}).items(), reverse=True):
+            unit_name = f'{league_name} {season}'
+            seasons.add(season)
+            priorities[unit_name] = league.get('priority', 0)
+            for site_name, value in site_values.items():
+                leagues.setdefault(site_name, {})[unit_name] = config_value(value)
+                if site_name not in latest_sites:
+                    latest_sites.add(site_name)
+                    latest_leagues.setdefault(site_name, {})[unit_name] = config_value(value)
+    return CrawlConfig(
+        concurrency=crawl.get('concurrency', 8),
+        host_concurrency=crawl.get('host_concurrency', 1),
+        hosts=raw.get('hosts', {}),
+        budget_seconds=crawl.get('budget_seconds'),
+        leagues=leagues,
+        latest_leagues=latest_leagues,
+        priorities=priorities,
+        seasons=len(seasons),
+        hedging=raw.get('hedging', {}),
+    )
+
+@dataclass(order=True)
+class CrawlUnit:
+    """One league or club page to scrape, ordered by priority then submission"""
+    priority: int
+    seq: int
+    site: str = field(compare=False)
+    kind: str = field(compare=False)
+    name: str = field(compare=False)
+    host: str = field(compare=False)
+    fetch: object = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+class CrawlBudgetExceeded(Exception):
+    pass
+
+class CrawlScheduler:
+    """Runs crawl units by priority under a global concurrency cap and per host caps
+
+    Units wait in one priority queue per host, and the dispatcher starts the highest priority unit whose
+    host has a free slot, so a backlog on one host never holds slots another host could use. Unit outcomes
+    are recorded in the progress journal, so units skipped or cut off by the budget are reported as
+    failures and picked up by a rerun with the same journal.
+    """
+    def __init__(self, config: CrawlConfig = None, journal: ProgressJournal = None) -> None:
+        self.config = config or CrawlConfig()
+        self.journal = journal or ProgressJournal()
+        self.hedger = HedgedRequests(**self.config.hedging)
+        self.pending = defaultdict(list)
+        self.host_running = defaultdict(int)
+        self.running = 0
+        self.seq = itertools.count()
+        self.tasks = set()
+        self.wakeup = None
+        self.dispatcher = None
+        self.deadline = None
+
+    def priority(self, unit_name: str) -> int:
+        return self.config.priorities.get(unit_name, 0)
+
+    def site_leagues(self, site) -> dict:
+        """Gets the leagues a site should crawl, the site's own leagues when the config doesn't set them
+
+        Sites whose squad pages ignore the season (seasonal_squads False) only crawl the newest season of each
+        league, as older seasons would fetch the current squads of clubs again.
+        """
+        if self.config.leagues is None:
+            return site.leagues
+        if not site.seasonal_squads and self.config.latest_leagues is not None:
+            return self.config.latest_leagues.get(site.name, {})
+        return self.config.leagues.get(site.name, {})
+
+    def keep_latest(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Keeps the first (most recent season) row of each club or player scraped in several seasons"""
+        if self.config.seasons <= 1 or df.empty:
+            return df
+        return df.drop_duplicates(subset=['site', 'id', 'name'])
+
+    def host_cap(self, host: str) -> int:
+        return self.config.hosts.get(host, self.config.host_concurrency)
+
+    def start(self) -> None:
+        if self.dispatcher is not None:
+            return
+        if self.config.budget_seconds is not None:
+            self.deadline = time.monotonic() + self.config.budget_seconds
+        self.wakeup = asyncio.Event()
+        self.dispatcher = asyncio.create_task(self.dispatch())
+
+    async def stop(self) -> None:
+        if self.dispatcher is not None:
+            self.dispatcher.cancel()
+            await asyncio.gather(self.dispatcher, return_exceptions=True)
+            self.dispatcher = None
+
+    async def dispatch(self) -> None:
+        """Starts queued units whenever a unit is queued or a running unit frees its slots"""
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            while self.running < self.config.concurrency:
+                ready = [units[0] for host, units in self.pending.items() if units and self.host_running[host] < self.host_cap(host)]
+                if not ready:
+                    break
+                unit = min(ready)
+                heapq.heappop(self.pending[unit.host])
+                self.running += 1
+                self.host_running[unit.host] += 1
+                task = asyncio.create_task(self.run_unit(unit))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+
+    async def fetch_within_budget(self, unit: CrawlUnit):
+        if self.deadline is None:
+            return await unit.fetch()
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise CrawlBudgetExceeded('crawl budget exhausted before the unit started')
+        try:
+            return await asyncio.wait_for(unit.fetch(), remaining)
+        except asyncio.TimeoutError:
+            raise CrawlBudgetExceeded('crawl budget exhausted while the unit was running') from None
+
+    async def run_unit(self, unit: CrawlUnit) -> None:
+        key = self.journal.key(unit.site, unit.kind, unit.name)
+        try:
+            result = await self.fetch_within_budget(unit)
+        except Exception as e:
+            self.journal.record_failure(key, e)
+            metrics.inc('crawl_units', site=unit.site, kind=unit.kind, status=type(e).__name__)
+            result = None
+        else:
+            self.journal.record_success(key, result)
+            metrics.inc('crawl_units', site=unit.site, kind=unit.kind, status='ok')
+        finally:
+            self.running -= 1
+            self.host_running[unit.host] -= 1
+            self.wakeup.set()
+        if not unit.future.done(): # the site waiting on the unit may have been cancelled
+            unit.future.set_result(result)
+
+    async def gather(self, site: str, kind: str, units: list[tuple], default=None) -> list:
+        """Queues a site's (name, url, league, fetch) units and returns their results in submission order
+
+        Units take the priority of the league they belong to. Units already journaled as successful are not
+        queued again. Failed units return default (an empty list if not given), with the error recorded in the journal.
+        """
+        self.start()
+        futures = []
+        for name, url, league, fetch in units:
+            future = asyncio.get_running_loop().create_future()
+            key = self.journal.key(site, kind, name)
+            if self.journal.succeeded(key):
+                future.set_result(self.journal.decode(self.journal.units[key]['result']))
+            else:
+                host = urlparse(url).netloc
+                heapq.heappush(self.pending[host], CrawlUnit(self.priority(league), next(self.seq), site, kind, name, host, fetch, future))
+            futures.append(future)
+        self.wakeup.set()
+        results = await asyncio.gather(*futures)
+        return [([] if default is None else default) if result is None else result for result in results]
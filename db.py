@@ -1,32 +1,54 @@
 import psycopg2
 from psycopg2 import sql
+from psycopg2.pool import ThreadedConnectionPool
 from dotenv import load_dotenv
 import pandas as pd
+import asyncio
+import io
 import os
+import threading
+from sinks import MatchSink, sinks, table_sites
+
+class BlockingConnectionPool(ThreadedConnectionPool):
+    """ThreadedConnectionPool whose getconn waits for a connection to be put back instead of raising PoolError when all are checked out"""
+    def __init__(self, minconn: int, maxconn: int, *args, **kwargs) -> None:
+        self.slots = threading.BoundedSemaphore(maxconn)
+        super().__init__(minconn, maxconn, *args, **kwargs)
+
+    def getconn(self, key=None):
+        self.slots.acquire()
+        try:
+            return super().getconn(key)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def putconn(self, conn=None, key=None, close=False) -> None:
+        super().putconn(conn, key, close)
+        self.slots.release()
 
 class PgInitTables:
     """Class to initialize database, establish a connection and creating tables"""
-    def __init__(self) -> None:
-        """Loads environment variables and generates site table names for database"""
+    def __init__(self, conn=None) -> None:
+        """Loads environment variables and generates site table names for database, connecting unless given a connection"""
         load_dotenv()
-        self.conn = psycopg2.connect(
-                        host = os.getenv("HOST"),
-                        port = os.getenv("PORT"),
-                        database = os.getenv("DATABASE"),
-                        user = os.getenv("USER"),
-                        password = os.getenv("PASSWORD"),
+        self.conn = conn or self.connect()
+        self.sites = table_sites
+        self.all_table_names = [site + '_teams' for site in self.sites] + [site + '_players' for site in self.sites] + ['players', 'teams', 'player_crosswalk', 'team_crosswalk']
+
+    def db_params(self) -> dict:
+        """Reads database connection parameters from environment variables"""
+        return dict(
+            host = os.getenv("HOST"),
+            port = os.getenv("PORT"),
+            database = os.getenv("DATABASE"),
+            user = os.getenv("USER"),
+            password = os.getenv("PASSWORD"),
         )
-        self.sites = [
-                'transfermrkt', 
-                'sofascore', 
-                'fbref', 
-                'understat', 
-                'whoscored', 
-                'soccerment',
-                'capology',
-                'fotmob',
-        ]
-        self.all_table_names = [site + '_teams' for site in self.sites] + [site + '_players' for site in self.sites] + ['players', 'teams']
+
+    def connect(self):
+        """Establishes the connection used to create tables"""
+        return psycopg2.connect(**self.db_params())
 
     def create_id_tables(self) -> None:
         """Creates base table to store primary IDs (ID is row index of loaded dataframe)"""
@@ -60,6 +82,7 @@ class PgInitTables:
                 site_name VARCHAR(255),
                 site_team_id VARCHAR(255),
                 site_url VARCHAR(255),
+                PRIMARY KEY (team_id),
                 FOREIGN KEY (team_id)
                     REFERENCES teams (team_id)
             );
@@ -81,6 +104,7 @@ class PgInitTables:
                 site_player_name VARCHAR(255),
                 site_player_id VARCHAR(255),
                 site_url VARCHAR(255),
+                PRIMARY KEY (player_id),
                 FOREIGN KEY (player_id)
                     REFERENCES players (player_id)
             );
@@ -93,6 +117,10 @@ class PgInitTables:
                     sql.SQL(site_table).format(sql.Identifier(site_table_name))
                 )
 
+    def notify_reload(self, cur) -> None:
+        """Signals listening ID services to reload once the current transaction commits"""
+        cur.execute('NOTIFY crosswalk_reload;')
+
     def drop_all(self) -> None:
         """Drops all tables in db to ensure duplicate data isn't being inserted"""
         drop_query = """
@@ -104,94 +132,448 @@ class PgInitTables:
                     sql.SQL(drop_query).format(sql.Identifier(name))
                 )
 
-class PgInsertMatches(PgInitTables):
-    """Class to insert data from loaded dataframes into the appropriate tables"""
-    def __init__(self, player_match_df: pd.DataFrame, club_match_df: pd.DataFrame) -> None:
+class PgInsertMatches(PgInitTables, MatchSink):
+    """Class to bulk insert data from loaded dataframes into the appropriate tables, the PostgreSQL sink
+
+    With crosswalk, the crosswalk tables and wide view (see PgCrosswalk) are rebuilt in the same transaction as the load.
+    """
+    def __init__(self, player_match_df: pd.DataFrame = None, club_match_df: pd.DataFrame = None, crosswalk: bool = False) -> None:
         """Calls init of parent to initialize db and loads in player and team dataframes"""
         super().__init__()
         self.player_match_df = player_match_df
         self.club_match_df = club_match_df
-        self.teams_insert = """
-            INSERT INTO teams
-            VALUES (%s, %s);
-        """
-        self.players_insert = """
-            INSERT INTO players
-            VALUES (%s, %s, %s);
-        """
-        self.site_teams_insert = """
-            INSERT INTO {}
-            VALUES (%s, %s, %s, %s);
-        """
-        self.site_players_insert = """
-            INSERT INTO {}
-            VALUES (%s, %s, %s, %s);
-        """
-
-    def insert_team_id(self, row, cur) -> None:
-        """Inserts team row into base team table"""
-        id_values = [row.name, row['name_sofascore']]
-        cur.execute(self.teams_insert, id_values)
-
-    def insert_player_id(self, row, cur) -> None:
-        """Inserts player row into base team table"""
-        team_id = int(self.club_match_df[self.club_match_df.name_sofascore == row['team_sofascore']].index[0])
-        id_values = [row.name, row['name_fotmob'], team_id]
-        cur.execute(self.players_insert, id_values)
-
-    def get_site_values(self, row, site, site_type) -> tuple[str, list]:
-        """For a given row, retrieves data specific to the given site"""
-        site_indices = list(filter(lambda x: x.endswith(site) and x.split('_')[0] not in ['league', 'team', 'site'], row.index))
-        table_name = site + site_type
-        site_values = [row.name] + row[site_indices].values.tolist()
-        return table_name, site_values
-
-    def insert_site_team(self, row, site, cur) -> None:
-        """Inserts team data into the team site table of the given site"""
-        table_name, site_values = self.get_site_values(row, site, '_teams')
+        self.crosswalk = crosswalk
+        self.copy_query = """
+            COPY {} FROM STDIN WITH (FORMAT csv);
+        """
+
+    def copy_rows(self, cur, table_name: str, rows: pd.DataFrame) -> None:
+        """Streams dataframe rows into the given table with COPY FROM STDIN"""
+        buffer = io.StringIO()
+        rows.to_csv(buffer, index=False, header=False)
+        buffer.seek(0)
+        cur.copy_expert(
+            sql.SQL(self.copy_query).format(sql.Identifier(table_name)),
+            buffer
+        )
+
+    def insert_teams(self, cur) -> None:
+        """Copies club_match_df into the base team table and every team site table"""
+        self.copy_rows(cur, 'teams', self.team_rows())
+        for site in self.sites:
+            self.copy_rows(cur, site + '_teams', self.site_rows(self.club_match_df, site))
+
+    def insert_players(self, cur) -> None:
+        """Copies player_match_df into the base player table and every player site table"""
+        self.copy_rows(cur, 'players', self.player_rows())
+        for site in self.sites:
+            self.copy_rows(cur, site + '_players', self.site_rows(self.player_match_df, site))
+
+    def sync_crosswalk(self) -> None:
+        """Rebuilds the crosswalk from the loaded site tables in the current transaction, when the load maintains it"""
+        if self.crosswalk:
+            PgCrosswalk(self.conn).sync()
+
+    def vacuum_crosswalk(self) -> None:
+        """Vacuums the crosswalk once the load is committed, when the load maintains it"""
+        if self.crosswalk:
+            PgCrosswalk(self.conn).vacuum()
+
+    async def close(self) -> None:
+        """Closes the connection of a load that never ran"""
+        if not self.conn.closed:
+            self.conn.close()
+
+    def run(self) -> None:
+        """Runs create functions of parent class and bulk copies dataframe rows into the appropriate tables"""
+        self.drop_all()
+        self.create_id_tables()
+        self.create_site_team_tables()
+        self.create_site_player_tables()
+        with self.conn.cursor() as cur:
+            self.insert_teams(cur)
+            self.insert_players(cur)
+            self.sync_crosswalk()
+            self.notify_reload(cur)
+        self.conn.commit()
+        self.vacuum_crosswalk()
+        self.conn.close()
+
+class PgUpsertMatches(PgInsertMatches):
+    """Class to incrementally load dataframes by diffing staged rows against the live tables
+
+    Team IDs are keyed on the sofascore team ID and player IDs on the fotmob player ID so they stay stable across runs.
+    Every insert, update and delete is applied in one transaction, so readers keep seeing the previous load until commit.
+    """
+    def __init__(self, player_match_df: pd.DataFrame = None, club_match_df: pd.DataFrame = None, crosswalk: bool = False) -> None:
+        """Calls init of parent and defines the staging and diff queries"""
+        super().__init__(player_match_df, club_match_df, crosswalk)
+        self.sequence_query = """
+            CREATE SEQUENCE IF NOT EXISTS {seq} MINVALUE 0;
+            SELECT setval(%(seq)s, GREATEST(COALESCE(MAX({id_col}), 0), (SELECT last_value FROM {seq})))
+            FROM {table};
+        """
+        self.stage_query = """
+            CREATE TEMP TABLE {stage} (LIKE {table}) ON COMMIT DROP;
+        """
+        self.upsert_query = """
+            INSERT INTO {table}
+            SELECT * FROM {stage}
+            ON CONFLICT ({key}) DO UPDATE
+                SET ({cols}) = ROW({excluded_cols})
+                WHERE ({live_cols}) IS DISTINCT FROM ({excluded_cols});
+        """
+        self.delete_query = """
+            DELETE FROM {table} AS live
+            WHERE NOT EXISTS (SELECT 1 FROM {stage} AS stage WHERE stage.{key} = live.{key});
+        """
+
+    def next_ids(self, cur, table: str, id_col: str, count: int) -> list:
+        """Draws new IDs from a sequence kept ahead of every ID already in the table"""
+        seq = table + '_id_seq'
         cur.execute(
-            sql.SQL(self.site_teams_insert).format(sql.Identifier(table_name)),
-            site_values
+            sql.SQL(self.sequence_query).format(seq=sql.Identifier(seq), id_col=sql.Identifier(id_col), table=sql.Identifier(table)),
+            {'seq': seq}
         )
+        cur.execute('SELECT nextval(%s) FROM generate_series(1, %s);', (seq, count))
+        return [row[0] for row in cur.fetchall()]
 
-    def insert_site_player(self, row, site, cur) -> None:
-        """Inserts player data into the player site table of the given site"""
-        table_name, site_values = self.get_site_values(row, site, '_players')
+    def stable_ids(self, cur, df: pd.DataFrame, key_col: str, table: str, id_col: str, site_table: str, site_key_col: str) -> pd.DataFrame:
+        """Reindexes a match dataframe by the IDs already assigned to its site keys, assigning new IDs to unseen keys"""
+        df = df.drop_duplicates(subset=key_col)
         cur.execute(
-            sql.SQL(self.site_players_insert).format(sql.Identifier(table_name)),
-            site_values
+            sql.SQL('SELECT {}, {} FROM {};').format(sql.Identifier(site_key_col), sql.Identifier(id_col), sql.Identifier(site_table))
+        )
+        live_ids = dict(cur.fetchall())
+        ids = df[key_col].astype(str).map(live_ids)
+        new_ids = ids.isna()
+        if new_ids.any():
+            ids[new_ids] = self.next_ids(cur, table, id_col, int(new_ids.sum()))
+        return df.set_index(pd.Index(ids.astype(int).values))
+
+    def table_columns(self, cur, table: str) -> list:
+        """Retrieves the column names of a live table in order, ignoring same named tables in other schemas such as the async load's staging schema"""
+        cur.execute(
+            'SELECT column_name FROM information_schema.columns WHERE table_schema = current_schema() AND table_name = %s ORDER BY ordinal_position;',
+            (table,)
+        )
+        return [row[0] for row in cur.fetchall()]
+
+    def stage_rows(self, cur, table: str, rows: pd.DataFrame) -> None:
+        """Copies rows into a temporary staging table shaped like the given live table"""
+        cur.execute(
+            sql.SQL(self.stage_query).format(stage=sql.Identifier('stage_' + table), table=sql.Identifier(table))
+        )
+        self.copy_rows(cur, 'stage_' + table, rows)
+
+    def upsert_table(self, cur, table: str) -> None:
+        """Inserts new rows and updates changed rows of a live table from its staging table"""
+        key, *cols = self.table_columns(cur, table)
+        cur.execute(
+            sql.SQL(self.upsert_query).format(
+                table=sql.Identifier(table),
+                stage=sql.Identifier('stage_' + table),
+                key=sql.Identifier(key),
+                cols=sql.SQL(', ').join(map(sql.Identifier, cols)),
+                live_cols=sql.SQL(', ').join(sql.Identifier(table, col) for col in cols),
+                excluded_cols=sql.SQL(', ').join(sql.Identifier('excluded', col) for col in cols),
+            )
+        )
+
+    def delete_missing(self, cur, table: str) -> None:
+        """Deletes live rows that are no longer present in the staging table"""
+        key = self.table_columns(cur, table)[0]
+        cur.execute(
+            sql.SQL(self.delete_query).format(table=sql.Identifier(table), stage=sql.Identifier('stage_' + table), key=sql.Identifier(key))
+        )
+
+    def stage_all(self, cur) -> list[str]:
+        """Stages rows for every table, returning table names in foreign key dependency order"""
+        staged = self.table_rows()
+        for table, rows in staged.items():
+            self.stage_rows(cur, table, rows)
+        return list(staged)
+
+    def run(self) -> None:
+        """Creates missing tables, stages dataframe rows and applies only the diff against the live tables"""
+        with self.conn:
+            self.create_id_tables()
+            self.create_site_team_tables()
+            self.create_site_player_tables()
+            with self.conn.cursor() as cur:
+                self.club_match_df = self.stable_ids(cur, self.club_match_df, 'id_sofascore', 'teams', 'team_id', 'sofascore_teams', 'site_team_id')
+                self.player_match_df = self.stable_ids(cur, self.player_match_df, 'id_fotmob', 'players', 'player_id', 'fotmob_players', 'site_player_id')
+                tables = self.stage_all(cur)
+                for table in tables:
+                    self.upsert_table(cur, table)
+                for table in reversed(tables):
+                    self.delete_missing(cur, table)
+                self.sync_crosswalk()
+                self.notify_reload(cur)
+        self.vacuum_crosswalk()
+        self.conn.close()
+
+class PgCrosswalk(PgInitTables):
+    """Class to maintain the optional consolidated crosswalk schema on top of the per site tables
+
+    Each crosswalk table holds one narrow row per (site, site_id), list partitioned by site, with covering indexes
+    so site to site ID translations are answered with index-only scans. player_ids_wide is a materialized view
+    with one wide row per player that is refreshed concurrently. Site IDs shared by more than one row of a site
+    table (e.g. soccerment's placeholder club ID) can't be translated and are left out.
+    """
+    def __init__(self, conn=None) -> None:
+        """Calls init of parent and defines the crosswalk queries"""
+        super().__init__(conn)
+        self.entities = {
+            'player': ('players', 'player_id', 'site_player_id', 'site_player_name'),
+            'team': ('teams', 'team_id', 'site_team_id', 'site_name'),
+        }
+        self.crosswalk_table = """
+            CREATE TABLE IF NOT EXISTS {table} (
+                site VARCHAR(32),
+                site_id VARCHAR(255),
+                {id_col} INT NOT NULL,
+                site_name VARCHAR(255),
+                site_url VARCHAR(255),
+                PRIMARY KEY (site, site_id) INCLUDE ({id_col}),
+                FOREIGN KEY ({id_col})
+                    REFERENCES {base_table} ({id_col})
+                    ON DELETE CASCADE
+            ) PARTITION BY LIST (site);
+        """
+        self.crosswalk_partition = """
+            CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {table} FOR VALUES IN ({site});
+        """
+        self.crosswalk_index = """
+            CREATE INDEX IF NOT EXISTS {index} ON {table} ({id_col}, site) INCLUDE (site_id);
+        """
+        self.site_source = """
+            SELECT {site} AS site, {site_id_col} AS site_id, {id_col}, {site_name_col} AS site_name, site_url
+            FROM {site_table}
+            WHERE {site_id_col} IS NOT NULL
+                AND {site_id_col} NOT IN (SELECT {site_id_col} FROM {site_table} GROUP BY {site_id_col} HAVING COUNT(*) > 1)
+        """
+        self.crosswalk_upsert = """
+            INSERT INTO {table} (site, site_id, {id_col}, site_name, site_url)
+            {source}
+            ON CONFLICT (site, site_id) DO UPDATE
+                SET ({id_col}, site_name, site_url) = ROW(EXCLUDED.{id_col}, EXCLUDED.site_name, EXCLUDED.site_url)
+                WHERE ({table}.{id_col}, {table}.site_name, {table}.site_url)
+                    IS DISTINCT FROM (EXCLUDED.{id_col}, EXCLUDED.site_name, EXCLUDED.site_url);
+        """
+        self.crosswalk_delete = """
+            DELETE FROM {table} AS cw
+            WHERE cw.site = {site}
+                AND NOT EXISTS (SELECT 1 FROM ({source}) AS src WHERE src.site_id = cw.site_id);
+        """
+        self.wide_view = """
+            CREATE MATERIALIZED VIEW IF NOT EXISTS player_ids_wide AS
+            SELECT p.player_id, p.name, p.team_id, {site_cols}
+            FROM players AS p
+            LEFT JOIN player_crosswalk AS cw
+                ON cw.player_id = p.player_id
+            GROUP BY p.player_id, p.name, p.team_id;
+            CREATE UNIQUE INDEX IF NOT EXISTS player_ids_wide_player_id ON player_ids_wide (player_id);
+        """
+
+    def create_crosswalk_tables(self) -> None:
+        """Creates a crosswalk table partitioned by site for players and teams"""
+        with self.conn.cursor() as cur:
+            for entity, (base_table, id_col, _, _) in self.entities.items():
+                table = entity + '_crosswalk'
+                cur.execute(
+                    sql.SQL(self.crosswalk_table).format(table=sql.Identifier(table), id_col=sql.Identifier(id_col), base_table=sql.Identifier(base_table))
+                )
+                for site in self.sites:
+                    cur.execute(
+                        sql.SQL(self.crosswalk_partition).format(partition=sql.Identifier(f'{table}_{site}'), table=sql.Identifier(table), site=sql.Literal(site))
+                    )
+                cur.execute(
+                    sql.SQL(self.crosswalk_index).format(index=sql.Identifier(f'{table}_{id_col}'), table=sql.Identifier(table), id_col=sql.Identifier(id_col))
+                )
+
+    def create_wide_view(self) -> None:
+        """Creates the materialized view with one row per player and a column per site ID"""
+        site_cols = sql.SQL(', ').join(
+            sql.SQL('MAX(cw.site_id) FILTER (WHERE cw.site = {}) AS {}').format(sql.Literal(site), sql.Identifier(site + '_id'))
+            for site in self.sites
         )
+        with self.conn.cursor() as cur:
+            cur.execute(sql.SQL(self.wide_view).format(site_cols=site_cols))
 
-    def insert_team_main(self, row) -> None:
-        """Inserts team row into the base team table and every team site table"""
+    def sync_site(self, cur, entity: str, site: str) -> None:
+        """Upserts one site's IDs into a crosswalk table and removes IDs no longer in the site table"""
+        _, id_col, site_id_col, site_name_col = self.entities[entity]
+        table = sql.Identifier(entity + '_crosswalk')
+        source = sql.SQL(self.site_source).format(
+            site=sql.Literal(site),
+            site_id_col=sql.Identifier(site_id_col),
+            id_col=sql.Identifier(id_col),
+            site_name_col=sql.Identifier(site_name_col),
+            site_table=sql.Identifier(f'{site}_{entity}s'),
+        )
+        cur.execute(sql.SQL(self.crosswalk_upsert).format(table=table, id_col=sql.Identifier(id_col), source=source))
+        cur.execute(sql.SQL(self.crosswalk_delete).format(table=table, site=sql.Literal(site), source=source))
+
+    def vacuum(self) -> None:
+        """Updates visibility maps and statistics so lookups can use index-only scans"""
+        self.conn.autocommit = True
         with self.conn.cursor() as cur:
-            self.insert_team_id(row, cur)
-            for site in self.sites:
-                self.insert_site_team(row, site, cur)
+            for entity in self.entities:
+                cur.execute(sql.SQL('VACUUM (ANALYZE) {};').format(sql.Identifier(entity + '_crosswalk')))
+            cur.execute('VACUUM (ANALYZE) player_ids_wide;')
+        self.conn.autocommit = False
 
-    def insert_player_main(self, row) -> None:
-        """Inserts player row into the base player table and every player site table"""
+    def sync(self) -> None:
+        """Creates the crosswalk schema, syncs it with the site tables and refreshes the wide view, without committing"""
+        self.create_crosswalk_tables()
+        self.create_wide_view()
         with self.conn.cursor() as cur:
-            self.insert_player_id(row, cur)
-            for site in self.sites:
-                self.insert_site_player(row, site, cur)
+            for entity in self.entities:
+                for site in self.sites:
+                    self.sync_site(cur, entity, site)
+            cur.execute('REFRESH MATERIALIZED VIEW CONCURRENTLY player_ids_wide;')
 
     def run(self) -> None:
-        """Runs create functions of parent class and inserts dataframe rows into the appropriate tables"""
-        self.drop_all()
+        """Syncs the crosswalk in one transaction, then vacuums it"""
+        with self.conn:
+            self.sync()
+            with self.conn.cursor() as cur:
+                self.notify_reload(cur)
+        self.vacuum()
+        self.conn.close()
+
+class PgAsyncLoad(PgInsertMatches):
+    """Class to load match tables over a connection pool while the rest of the pipeline is still running
+
+    Tables are created and copied into a staging schema, so schema creation, club tables and player tables can each
+    start as soon as their input is ready and site tables can be copied in parallel over pooled connections.
+    Once every table is loaded, the live tables are dropped and the staged ones moved in within one transaction,
+    so readers see the previous load until the whole new one is in place, and a failed run leaves the live tables untouched.
+    Like PgInsertMatches, every load gets new IDs and drops the crosswalk with the live tables; with crosswalk, it's
+    rebuilt in the swap transaction. Stable IDs need the PgUpsertMatches loader (driver --incremental) instead.
+    """
+    staging_schema = 'crosswalk_staging'
+
+    def __init__(self, pool_size: int = None, crosswalk: bool = False) -> None:
+        """Calls init of parent with no dataframes, as they are handed over once each transform stage finishes
+
+        The pool defaults to a connection per site table copied in parallel plus the main connection.
+        """
+        self.pool_size = pool_size or len(self.sites) + 1
+        self.schema_task = None
+        self.clubs_task = None
+        self.pool = None
+        super().__init__(None, None, crosswalk)
+
+    def connect(self):
+        """Creates the connection pool and checks out the connection used to create tables and base rows"""
+        self.pool = BlockingConnectionPool(1, self.pool_size, **self.db_params())
+        return self.pool.getconn()
+
+    def use_staging(self, cur) -> None:
+        """Points unqualified table names at the staging schema for the rest of the transaction"""
+        cur.execute(sql.SQL('SET LOCAL search_path TO {};').format(sql.Identifier(self.staging_schema)))
+
+    def load_tables(self) -> list[str]:
+        return ['teams', 'players'] + [site + '_teams' for site in self.sites] + [site + '_players' for site in self.sites]
+
+    def create_schema(self) -> None:
+        """Recreates the staging schema and every table in it"""
+        with self.conn.cursor() as cur:
+            cur.execute(sql.SQL('DROP SCHEMA IF EXISTS {} CASCADE;').format(sql.Identifier(self.staging_schema)))
+            cur.execute(sql.SQL('CREATE SCHEMA {};').format(sql.Identifier(self.staging_schema)))
+            self.use_staging(cur)
         self.create_id_tables()
         self.create_site_team_tables()
         self.create_site_player_tables()
-        self.club_match_df.apply(self.insert_team_main, axis=1)
-        self.player_match_df.apply(self.insert_player_main, axis=1)
         self.conn.commit()
-        self.conn.close()
 
-def load_main(player_match_df, club_match_df):
-    """Loads player and team dataframes into the specified PostgreSQL database"""
-    PgInsertMatches(player_match_df, club_match_df).run()
+    def copy_base_table(self, table_name: str, rows: pd.DataFrame) -> None:
+        """Copies rows into a staged base table on the main connection"""
+        with self.conn.cursor() as cur:
+            self.use_staging(cur)
+            self.copy_rows(cur, table_name, rows)
+        self.conn.commit()
+
+    def copy_site_table(self, table_name: str, rows: pd.DataFrame) -> None:
+        """Copies rows into a staged site table on a pooled connection"""
+        conn = self.pool.getconn()
+        try:
+            with conn, conn.cursor() as cur:
+                self.use_staging(cur)
+                self.copy_rows(cur, table_name, rows)
+        finally:
+            self.pool.putconn(conn)
+
+    async def copy_site_tables(self, df: pd.DataFrame, site_type: str) -> None:
+        """Copies every site table of the given type in parallel"""
+        copy_tasks = [asyncio.to_thread(self.copy_site_table, site + site_type, self.site_rows(df, site)) for site in self.sites]
+        await asyncio.gather(*copy_tasks)
 
-        
-        
+    def swap_in(self) -> None:
+        """Replaces the live tables with the staged ones, and rebuilds the crosswalk if maintained, in one transaction"""
+        with self.conn.cursor() as cur:
+            cur.execute('SELECT current_schema();')
+            live_schema = cur.fetchone()[0]
+            self.drop_all()
+            for table in self.load_tables():
+                cur.execute(
+                    sql.SQL('ALTER TABLE {} SET SCHEMA {};').format(sql.Identifier(self.staging_schema, table), sql.Identifier(live_schema))
+                )
+            cur.execute(sql.SQL('DROP SCHEMA {};').format(sql.Identifier(self.staging_schema)))
+            self.sync_crosswalk()
+            self.notify_reload(cur)
+        self.conn.commit()
+        self.vacuum_crosswalk()
+
+    def start(self) -> None:
+        """Starts creating the staging schema in the background"""
+        self.schema_task = asyncio.create_task(asyncio.to_thread(self.create_schema))
+
+    async def load_clubs(self, club_match_df: pd.DataFrame) -> None:
+        """Loads the base team table and every team site table once the schema exists"""
+        self.club_match_df = club_match_df
+        await self.schema_task
+        await asyncio.to_thread(self.copy_base_table, 'teams', self.team_rows())
+        await self.copy_site_tables(self.club_match_df, '_teams')
+
+    def start_clubs(self, club_match_df: pd.DataFrame) -> None:
+        """Starts loading club tables in the background"""
+        self.clubs_task = asyncio.create_task(self.load_clubs(club_match_df))
+
+    async def load_players(self, player_match_df: pd.DataFrame) -> None:
+        """Loads the base player table and every player site table once club tables are loaded, then swaps the load in"""
+        self.player_match_df = player_match_df
+        await self.clubs_task
+        await asyncio.to_thread(self.copy_base_table, 'players', self.player_rows())
+        await self.copy_site_tables(self.player_match_df, '_players')
+        await asyncio.to_thread(self.swap_in)
+
+    async def close(self) -> None:
+        """Waits for background steps still running, as their threads hold pooled connections, then closes the pool
+
+        A run stopped before load_players leaves only the staging schema behind, which the next run recreates.
+        """
+        await asyncio.gather(*[task for task in [self.schema_task, self.clubs_task] if task is not None], return_exceptions=True)
+        if self.pool is not None and not self.pool.closed:
+            self.conn.rollback()
+            self.pool.putconn(self.conn)
+            self.pool.closeall()
 
+def load_main(player_match_df, club_match_df, incremental=False, crosswalk=False, sink=None, path=None):
+    """Loads player and team dataframes into the specified PostgreSQL database, or writes them with a file sink
 
+    Keyword arguments:
+    incremental -- upsert only the differences against the live tables instead of dropping and recreating them
+    crosswalk -- also maintain the consolidated crosswalk tables and wide materialized view, in the load's transaction
+    sink -- write the same tables with one of sinks.sinks ('parquet', 'duckdb' or 'sqlite') instead of PostgreSQL
+    path -- file or directory the sink writes, the sink's default when None
+    """
+    if sink is not None:
+        sinks[sink](player_match_df, club_match_df, path).run()
+        return
+    if incremental:
+        PgUpsertMatches(player_match_df, club_match_df, crosswalk).run()
+    else:
+        PgInsertMatches(player_match_df, club_match_df, crosswalk).run()
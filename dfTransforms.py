@@ -1,9 +1,23 @@
 from unidecode import unidecode
 import re
 import asyncio
+import contextlib
 import pandas as pd
 import numpy as np
-from nameMatches import PlayerMatchesBySite, ClubMatchesBySite
+from nameMatches import PlayerMatchesBySite, ClubMatchesBySite, CrossClubMatchesBySite
+from metrics import metrics
+from profiling import pipeline_stage
+
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+def copy_on_write():
+    """Turns on copy-on-write for the transform on pandas 2 (always on from pandas 3), so per site slices share memory with the frame they come from"""
+    if pd.__version__.startswith('2.'):
+        return pd.option_context('mode.copy_on_write', True)
+    return contextlib.nullcontext()
 
 class PipeBase:
     """Pipeline base class, stores class variables accessible to child classes to modify"""
@@ -28,14 +42,26 @@ The pipeline stages either create or modify class variables within a PipeBase in
 
 class LoadDataFrames(PipeBase):
     """Loads player and club dataframes generated by the site scrapers
-    
+
+    Low cardinality columns are stored as categoricals and text columns as Arrow backed strings,
+    so the copies made by later stages stay small.
+
     Creates:
     player_df
     club_df
     """
+    category_cols = ['site', 'team', 'league']
+    string_cols = ['name', 'url']
+    string_dtype = pd.StringDtype('pyarrow')
+
+    def lean_dtypes(self, df: pd.DataFrame) -> pd.DataFrame:
+        dtypes = {col: 'category' for col in self.category_cols if col in df.columns}
+        dtypes.update({col: self.string_dtype for col in self.string_cols if col in df.columns})
+        return df.astype(dtypes)
+
     def load_dfs(self, player_df: pd.DataFrame, club_df: pd.DataFrame) -> None:
-        PipeBase.player_df = player_df.drop_duplicates()
-        PipeBase.club_df = club_df.drop_duplicates()
+        PipeBase.player_df = self.lean_dtypes(player_df).drop_duplicates()
+        PipeBase.club_df = self.lean_dtypes(club_df).drop_duplicates()
     
 class FormatNames(PipeBase):
     """Removes accents from player name characters
@@ -47,7 +73,7 @@ class FormatNames(PipeBase):
         return re.sub(r'[^a-z\s]', ' ', unidecode(str(name).lower()))
 
     def run(self) -> None:
-        PipeBase.player_df['processedName'] = PipeBase.player_df.name.apply(self.player_name)
+        PipeBase.player_df['processedName'] = PipeBase.player_df.name.apply(self.player_name).astype(LoadDataFrames.string_dtype)
 
 class SplitBySite(PipeBase):
     """Splits main player and team dataframes by site
@@ -57,7 +83,15 @@ class SplitBySite(PipeBase):
     site_dfs_clubs -- club_df split by site
     """
     def split_df(self, df: pd.DataFrame) -> list[pd.DataFrame]:
-        return [df[df['site'] == site] for site in PipeBase.sites]
+        """Sorts by site once and slices out each site, keeping each site's original row order"""
+        df = df.sort_values('site', kind='stable')
+        codes = df['site'].cat.codes.to_numpy()
+        categories = df['site'].cat.categories
+        site_dfs = []
+        for site in PipeBase.sites:
+            code = categories.get_loc(site) if site in categories else -1
+            site_dfs.append(df.iloc[np.searchsorted(codes, code, 'left'):np.searchsorted(codes, code, 'right')])
+        return site_dfs
 
     def filter_duplicate_names(self, df: pd.DataFrame) -> pd.DataFrame:
         return df[df.name.duplicated(keep=False) == False]
@@ -95,7 +129,7 @@ class ClubNameMatches(PipeBase):
     def apply_map_to_sitedfs(self) -> None:
         sites = PipeBase.site_dfs
         for site in sites:
-            site['team'] = site.team.apply(self.map_team_matches)
+            site['team'] = site.team.cat.remove_unused_categories().map(self.map_team_matches).astype('category') # maps each team name once
         PipeBase.site_dfs = sites
 
     def apply_map_to_clubdf(self) -> None:
@@ -104,10 +138,13 @@ class ClubNameMatches(PipeBase):
             site['namematch_index'] = site.name.apply(self.map_team_matches)
         PipeBase.site_dfs_clubs = sites
 
-    def run(self) -> None:
-        PipeBase.club_match_df = self.get_club_match_df()
+    def map_matches(self) -> None:
         df_c = PipeBase.club_match_df.copy()
         df_c.apply(self.get_row_matches, axis=1)
+
+    def run(self, club_match_df: pd.DataFrame = None) -> None:
+        PipeBase.club_match_df = self.get_club_match_df() if club_match_df is None else club_match_df
+        self.map_matches()
         self.apply_map_to_sitedfs()
         self.apply_map_to_clubdf()
 
@@ -121,6 +158,7 @@ class ClubSiteJoin(PipeBase):
         join_df = sites[0]
         for site in sites[1:]:
             join_df = join_df.merge(site, on='namematch_index', suffixes=(None, f'_{site.site.iat[1]}'))
+            metrics.set('join_rows', len(join_df), stage='ClubSiteJoin', site=site.site.iat[1])
         return join_df
 
     def run(self) -> None:
@@ -129,20 +167,46 @@ class ClubSiteJoin(PipeBase):
                             .rename(columns={col: col + '_transfermrkt' for col in ['name', 'id', 'url', 'site']})
                             .reset_index(drop=True))
 
+class ClubPartitions:
+    """Values of a column of the site dfs, grouped once by (site, team)
+
+    The column is reordered into one array with each site's clubs contiguous, so a club's values on a site
+    are a slice (a view, not a copy) of it instead of a mask scan of the site's whole df.
+    """
+    def __init__(self, site_dfs: list[pd.DataFrame], col: str = 'processedName') -> None:
+        frame = pd.concat([df[['team', col]] for df in site_dfs], ignore_index=True)
+        frame['site'] = np.repeat(np.arange(len(site_dfs)), [len(df) for df in site_dfs])
+        frame = frame[frame.team.notna()]
+        codes = frame.groupby(['site', 'team'], sort=False, observed=True).ngroup().to_numpy()
+        order = np.argsort(codes, kind='stable') # keeps each site's row order within a club
+        self.values = frame[col].to_numpy()[order]
+        bounds = np.concatenate([[0], np.cumsum(np.bincount(codes))])
+        firsts = frame.iloc[order[bounds[:-1]]]
+        self.slices = {(site, team): slice(start, end) for site, team, start, end in zip(firsts.site, firsts.team, bounds[:-1], bounds[1:])}
+        self.empty = self.values[:0]
+        self.site_count = len(site_dfs)
+
+    def get(self, site: int, team: str) -> np.ndarray:
+        """Gets the values of a team's rows in the site df at index site"""
+        bounds = self.slices.get((site, team))
+        return self.empty if bounds is None else self.values[bounds]
+
+    def club(self, team: str) -> list[np.ndarray]:
+        """Gets a team's values on every site, in site df order"""
+        return [self.get(site, team) for site in range(self.site_count)]
+
 class SplitSitesByClub(PipeBase):
     """Determines which players in each site df have naming discrepancies and splits them by team name
     to prepare them for the name matching stage
 
     Creates:
     players_left_by_site
+    club_partitions
     players_by_club
     """
     def split_site_dfs(self, sites: list[pd.DataFrame]) -> dict[str, list]:
-        splits_by_club = {}
-        for team in PipeBase.club_match_df.name_sofascore.unique():
-            sites_split_by_club = [site[site.team == team].processedName.values for site in sites]
-            splits_by_club[team] = sites_split_by_club
-        return splits_by_club
+        PipeBase.club_partitions = ClubPartitions(sites)
+        return {team: PipeBase.club_partitions.club(team) for team in PipeBase.club_match_df.name_sofascore.unique()}
 
     def run(self) -> None:
         PipeBase.players_left_by_site = PipeBase.site_dfs
@@ -157,9 +221,19 @@ class PlayerNameMatches(PipeBase):
     Modifies:
     player_match_map
     """
-    async def get_player_match_df(self, session) -> None:
-        matches_by_club = (PlayerMatchesBySite(players, club, session) for club, players in PipeBase.players_by_club.items())
-        match_result_tasks = [club.main() for club in matches_by_club]
+    async def club_match_df(self, club: str, players: list, session, squads) -> pd.DataFrame:
+        """Matches a club's players, reusing the squad cache's match rows when its players are unchanged on every site"""
+        if squads is None:
+            return await PlayerMatchesBySite(players, club, session).main()
+        fingerprint = squads.team_fingerprint(club, players)
+        match_df = squads.match_rows(club, fingerprint)
+        if match_df is None:
+            match_df = await PlayerMatchesBySite(players, club, session).main()
+            squads.store_match_rows(club, fingerprint, match_df)
+        return match_df
+
+    async def get_player_match_df(self, session, squads=None) -> None:
+        match_result_tasks = [self.club_match_df(club, players, session, squads) for club, players in PipeBase.players_by_club.items()]
         match_results = await asyncio.gather(*match_result_tasks)
         PipeBase.player_name_matches_df = pd.concat(match_results)
 
@@ -171,57 +245,254 @@ class PlayerNameMatches(PipeBase):
         for col in cols:
             PipeBase.player_match_map[row[col] + '---' + row['team']] = row['fotmob'] + '---' + row['team']
 
-    async def run(self, session) -> None:
-        await self.get_player_match_df(session)
+    async def run(self, session, player_name_matches_df: pd.DataFrame = None, squads=None) -> None:
+        if player_name_matches_df is None:
+            await self.get_player_match_df(session, squads)
+        else:
+            PipeBase.player_name_matches_df = player_name_matches_df
+        self.map_matches()
+
+    def map_matches(self) -> None:
         df_c = PipeBase.player_name_matches_df.copy()
         df_c.apply(self.get_name_matches, axis=1)
 
+class CrossClubNameMatches(PipeBase):
+    """Matches players left unmatched within their club against the leftover players of every club in their league,
+    so players listed under different clubs on different sites aren't dropped by PlayerSiteJoin
+
+    Modifies:
+    player_match_map
+    """
+    def player_keys(self, site: pd.DataFrame) -> pd.Series:
+        return site['processedName'] + '---' + site['team'].astype(LoadDataFrames.string_dtype)
+
+    def leftover_players(self, site: pd.DataFrame, team_leagues: dict) -> pd.DataFrame:
+        leftover = site[self.player_keys(site).map(PipeBase.player_match_map).isna()]
+        return pd.DataFrame({
+            'player': list(zip(leftover['processedName'], leftover['team'].astype(str))),
+            'league': leftover['team'].astype(str).map(team_leagues).to_numpy(),
+        })
+
+    def run(self) -> None:
+        team_leagues = dict(zip(PipeBase.club_match_df.name_sofascore.astype(str), PipeBase.club_match_df.league_sofascore.astype(str)))
+        leftovers = {site_name: self.leftover_players(site, team_leagues) for site_name, site in zip(PipeBase.sites, PipeBase.site_dfs)}
+        fm_leftovers = leftovers.pop('fotmob')
+        matched = 0
+        for league, fm_players in fm_leftovers.groupby('league').player:
+            players_by_site = {site_name: list(site.player[site.league == league]) for site_name, site in leftovers.items()}
+            for row in CrossClubMatchesBySite(list(fm_players), players_by_site).main():
+                fm_key = '---'.join(row['fotmob'])
+                for player in row.values():
+                    PipeBase.player_match_map['---'.join(player)] = fm_key
+                matched += 1
+        metrics.set('matched_rows', matched, stage='CrossClubNameMatches', site='fotmob')
+
 class PlayerSiteJoin(PipeBase):
     """Joins remaining players based on results of name matches stage and adds them to player_match_df
 
     Creates:
     player_match_df
     """
-    def get_namematch_index(self, row):
-        try:
-            return PipeBase.player_match_map[row['processedName'] + '---' + row['team']]
-        except KeyError:
-            return np.nan
+    def get_namematch_index(self, site: pd.DataFrame) -> pd.Series:
+        keys = site['processedName'] + '---' + site['team'].astype(LoadDataFrames.string_dtype)
+        return keys.map(PipeBase.player_match_map)
 
-    def set_namematch_col(self, site: pd.DataFrame) -> pd.DataFrame:
-        site['processedName'] = site.apply(self.get_namematch_index, axis=1)
-        return site.dropna(subset='processedName')
+    def namematch_indexes(self, sites: list[pd.DataFrame]) -> list:
+        return [self.get_namematch_index(site) for site in sites]
+
+    def set_namematch_col(self, site: pd.DataFrame, namematch_index) -> pd.DataFrame:
+        site['processedName'] = namematch_index
+        matched = site.dropna(subset='processedName')
+        metrics.set('matched_rows', len(matched), stage='PlayerSiteJoin', site=site.site.iat[1])
+        metrics.set('unmatched_rows', len(site) - len(matched), stage='PlayerSiteJoin', site=site.site.iat[1])
+        return matched
 
     def second_join(self, sites: list[pd.DataFrame]) -> pd.DataFrame:
         join_df = sites[0]
         for site in sites[1:]:
             join_df = join_df.merge(site, on='processedName', suffixes=(None, f'_{site.site.iat[1]}'))
+            metrics.set('join_rows', len(join_df), stage='PlayerSiteJoin', site=site.site.iat[1])
         final_join_result = join_df.rename(columns={'processedName': 'namematch_index'})
         return final_join_result
 
     def run(self) -> None:
-        sites_to_join = [self.set_namematch_col(site) for site in PipeBase.players_left_by_site]
+        sites = PipeBase.players_left_by_site
+        sites_to_join = [self.set_namematch_col(site, index) for site, index in zip(sites, self.namematch_indexes(sites))]
         PipeBase.player_match_df = (self.second_join(sites_to_join)
                             .drop('namematch_index', axis=1)
                             .rename(columns={col: col + '_transfermrkt' for col in ['name', 'id', 'team', 'url', 'site']})) # with the way join is set up, transfermrkt info only one that doesn't have site suffix
 
-async def transform_main(player_df, club_df, session) -> PipeBase:
-    """Creates instance of PipeBase, runs transformation child classes, and returns object w/ match dataframes"""
-    pipe = PipeBase()
-    LoadDataFrames().load_dfs(player_df, club_df)
-    FormatNames().run()
-    SplitBySite().run()
-    ClubNameMatches().run()
-    ClubSiteJoin().run()
-    SplitSitesByClub().run()
-    await PlayerNameMatches().run(session)
-    PlayerSiteJoin().run()
-    return pipe
-
-
-
-    
-
-
+"""
+Polars backend: the same stages with the site split, name maps, their application to club names and the joins
+run as lazy, multi-threaded Polars query plans. Only site names, match names, join keys and row positions go through
+Polars, and rows are taken from the pandas dfs, so every column keeps its pandas dtype and the output frames are the
+same as the pandas backend's. Name matching and the categorical team remap of apply_map_to_sitedfs (one lookup per
+category) stay in pandas.
+"""
 
+def polars_merge(sites: list[pd.DataFrame], key: str, stage: str) -> pd.DataFrame:
+    """Inner joins sites on key like chained merges with suffixes=(None, '_<site>'), keeping left then right row order"""
+    plans = [pl.LazyFrame({key: pl.from_pandas(sites[0][key]).cast(pl.String), 'row_0': np.arange(len(sites[0]))})]
+    for i, site in enumerate(sites[1:], 1):
+        rows = pl.LazyFrame({key: pl.from_pandas(site[key]).cast(pl.String), f'row_{i}': np.arange(len(site))})
+        plans.append(plans[-1].join(rows, on=key, nulls_equal=True, maintain_order='left_right'))
+    *join_counts, positions = pl.collect_all([plan.select(pl.len()) for plan in plans[1:-1]] + plans[-1:]) # one run shares the common joins
+    for site, join_rows in zip(sites[1:], [count.item() for count in join_counts] + [len(positions)]):
+        metrics.set('join_rows', join_rows, stage=stage, site=site.site.iat[1])
+    parts = [sites[0].iloc[positions['row_0'].to_numpy()].reset_index(drop=True)]
+    columns = set(parts[0].columns)
+    for i, site in enumerate(sites[1:], 1):
+        site_rows = site.drop(columns=key).iloc[positions[f'row_{i}'].to_numpy()].reset_index(drop=True)
+        suffix = f'_{site.site.iat[1]}'
+        parts.append(site_rows.rename(columns={col: col + suffix for col in site_rows.columns if col in columns}))
+        columns.update(parts[-1].columns)
+    return pd.concat(parts, axis=1)
+
+def polars_match_map(match_df: pd.DataFrame, key, match, exclude: list = []) -> pl.LazyFrame:
+    """Plans a match map as a (key, match) LazyFrame: every cell of a match_df row is a key mapping to the row's match,
+    with later cells winning like the row by row map of the pandas stages
+
+    Keyword arguments:
+    key -- expression of a cell's key, from the cell 'value' and the excluded columns
+    match -- expression of the row's match
+    exclude -- columns that aren't keys
+    """
+    columns = [col for col in match_df.columns if col not in exclude]
+    return (pl.from_pandas(match_df.astype(object)).lazy()
+                .select(pl.all().cast(pl.String))
+                .with_row_index('row')
+                .with_columns(match=match)
+                .unpivot(on=columns, index=['row', 'match', *exclude], variable_name='col', value_name='value')
+                .drop_nulls('value')
+                .with_columns(col=pl.col('col').replace_strict(columns, list(range(len(columns))), return_dtype=pl.Int64), key=key)
+                .sort('row', 'col')
+                .unique('key', keep='last', maintain_order=True)
+                .select('key', 'match'))
+
+def update_map(match_map: dict, matches: pl.DataFrame) -> None:
+    match_map.update(zip(matches['key'].to_list(), matches['match'].to_list()))
+
+class PolarsSplitBySite(SplitBySite):
+    """SplitBySite grouping each site's row positions in a Polars plan"""
+    def split_df(self, df: pd.DataFrame) -> list[pd.DataFrame]:
+        positions = (pl.LazyFrame({'site': pl.from_pandas(df['site']).cast(pl.String)})
+                        .with_row_index('row')
+                        .group_by('site')
+                        .agg('row') # keeps each site's original row order
+                        .collect())
+        rows_by_site = dict(zip(positions['site'].to_list(), positions['row'].to_list()))
+        return [df.iloc[rows_by_site.get(site, [])] for site in PipeBase.sites]
+
+class PolarsClubNameMatches(ClubNameMatches):
+    """ClubNameMatches planning team_match_map and its application to every site's club names in Polars, collected together"""
+    def club_plan(self, site: pd.DataFrame, team_matches: pl.LazyFrame) -> pl.LazyFrame:
+        return (pl.LazyFrame({'key': pl.from_pandas(site.name).cast(pl.String)})
+                    .join(team_matches, on='key', how='left', maintain_order='left'))
+
+    def run(self, club_match_df: pd.DataFrame = None) -> None:
+        PipeBase.club_match_df = self.get_club_match_df() if club_match_df is None else club_match_df
+        team_matches = polars_match_map(PipeBase.club_match_df, pl.col('value'), pl.col('sofascore'))
+        sites = PipeBase.site_dfs_clubs
+        team_match_df, *club_dfs = pl.collect_all([team_matches] + [self.club_plan(site, team_matches) for site in sites])
+        update_map(PipeBase.team_match_map, team_match_df)
+        self.apply_map_to_sitedfs()
+        for site, club_df in zip(sites, club_dfs):
+            unmatched = club_df.filter(pl.col('key').is_not_null() & ~pl.col('key').is_in(team_match_df['key']))
+            if len(unmatched):
+                raise KeyError(unmatched['key'][0]) # like the dict lookup of the pandas stage
+            site['namematch_index'] = club_df['match'].to_numpy()
+
+class PolarsClubSiteJoin(ClubSiteJoin):
+    """ClubSiteJoin planning the joins in Polars"""
+    def club_join(self, sites: list[pd.DataFrame]) -> pd.DataFrame:
+        return polars_merge(sites, 'namematch_index', 'ClubSiteJoin')
+
+class PolarsPlayerNameMatches(PlayerNameMatches):
+    """PlayerNameMatches planning player_match_map in Polars"""
+    def map_matches(self) -> None:
+        player_matches = polars_match_map(PipeBase.player_name_matches_df, pl.col('value') + '---' + pl.col('team'),
+                                          pl.col('fotmob') + '---' + pl.col('team'), exclude=['team'])
+        update_map(PipeBase.player_match_map, player_matches.collect())
+
+class PolarsPlayerSiteJoin(PlayerSiteJoin):
+    """PlayerSiteJoin mapping every site's player keys through player_match_map in one Polars plan per site,
+    collected together, and planning the joins in Polars"""
+    def namematch_indexes(self, sites: list[pd.DataFrame]) -> list:
+        matches = pl.LazyFrame({'key': list(PipeBase.player_match_map), 'match': list(PipeBase.player_match_map.values())},
+                               schema={'key': pl.String, 'match': pl.String})
+        plans = [pl.LazyFrame({'processedName': pl.from_pandas(site['processedName']).cast(pl.String),
+                               'team': pl.from_pandas(site['team'].astype(LoadDataFrames.string_dtype)).cast(pl.String)})
+                   .select(key=pl.col('processedName') + '---' + pl.col('team'))
+                   .join(matches, on='key', how='left', maintain_order='left')
+                   .select('match') for site in sites]
+        return [pd.Series(df['match'].to_numpy(), index=site.index) for site, df in zip(sites, pl.collect_all(plans))]
 
+    def second_join(self, sites: list[pd.DataFrame]) -> pd.DataFrame:
+        return polars_merge(sites, 'processedName', 'PlayerSiteJoin').rename(columns={'processedName': 'namematch_index'})
+
+backends = {
+    'pandas': {
+        'SplitBySite': SplitBySite,
+        'ClubNameMatches': ClubNameMatches,
+        'ClubSiteJoin': ClubSiteJoin,
+        'PlayerNameMatches': PlayerNameMatches,
+        'PlayerSiteJoin': PlayerSiteJoin,
+    },
+    'polars': {
+        'SplitBySite': PolarsSplitBySite,
+        'ClubNameMatches': PolarsClubNameMatches,
+        'ClubSiteJoin': PolarsClubSiteJoin,
+        'PlayerNameMatches': PolarsPlayerNameMatches,
+        'PlayerSiteJoin': PolarsPlayerSiteJoin,
+    },
+}
+
+async def transform_main(player_df, club_df, session, loader=None, checkpoints=None, squads=None, backend='pandas') -> PipeBase:
+    """Creates instance of PipeBase, runs transformation child classes, and returns object w/ match dataframes
+
+    Keyword arguments:
+    loader -- optional db.PgAsyncLoad or sinks.MatchSink that starts loading club tables as soon as ClubSiteJoin finishes
+    checkpoints -- optional checkpoints.Checkpoints to save name match and final match results to, or resume them from
+    squads -- optional squadCache.SquadCache reusing the player name matches of clubs whose players haven't changed
+    backend -- 'pandas', or 'polars' to run the site split, name maps, club name mapping and joins as Polars query plans
+    """
+    if backend == 'polars' and pl is None:
+        raise ImportError('The polars backend needs polars, pip install polars')
+    stages = backends[backend]
+    pipe = PipeBase()
+    with copy_on_write():
+        with pipeline_stage('LoadDataFrames'):
+            LoadDataFrames().load_dfs(player_df, club_df)
+        with pipeline_stage('FormatNames'):
+            FormatNames().run()
+        with pipeline_stage('SplitBySite'):
+            stages['SplitBySite']().run()
+        with pipeline_stage('ClubNameMatches'):
+            if checkpoints and checkpoints.resumes('club_names'):
+                stages['ClubNameMatches']().run(*checkpoints.load('club_names'))
+            else:
+                stages['ClubNameMatches']().run()
+                if checkpoints:
+                    checkpoints.save('club_names', PipeBase.club_match_df)
+        with pipeline_stage('ClubSiteJoin'):
+            stages['ClubSiteJoin']().run()
+        if loader:
+            loader.start_clubs(PipeBase.club_match_df)
+        with pipeline_stage('SplitSitesByClub'):
+            SplitSitesByClub().run()
+        with pipeline_stage('PlayerNameMatches'):
+            if checkpoints and checkpoints.resumes('player_names'):
+                await stages['PlayerNameMatches']().run(session, *checkpoints.load('player_names'))
+            else:
+                await stages['PlayerNameMatches']().run(session, squads=squads)
+                if checkpoints:
+                    checkpoints.save('player_names', PipeBase.player_name_matches_df)
+        with pipeline_stage('CrossClubNameMatches'):
+            CrossClubNameMatches().run()
+        with pipeline_stage('PlayerSiteJoin'):
+            stages['PlayerSiteJoin']().run()
+        metrics.set('rows', len(PipeBase.club_match_df), stage='transform', frame='club_match_df')
+        metrics.set('rows', len(PipeBase.player_match_df), stage='transform', frame='player_match_df')
+        if checkpoints:
+            checkpoints.save('matches', PipeBase.player_match_df, PipeBase.club_match_df)
+    return pipe
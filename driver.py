@@ -1,27 +1,116 @@
 import asyncio
-from playwright.async_api import async_playwright
-from aiohttp import ClientSession
+import argparse
 import pandas as pd
-from siteScrapers import extract_main
-from dfTransforms import transform_main
-from db import load_main
+from idIndex import build_index
+from checkpoints import Checkpoints
+from progressJournal import ProgressJournal
+from crawlScheduler import CrawlConfig, CrawlScheduler, load_config
+from squadCache import SquadCache
+from siteSessions import SiteSessions
+from jsonDecoders import decoders
+from sitePlugins import plugins, select, launch_browser
+from sinks import sinks
+from metrics import metrics
+from profiling import profiler, pipeline_stage
 import pathlib
 
 here = pathlib.Path(__file__).parent / 'test_CSVs'
 
-async def main() -> None:
-    """Runs pipeline webscraping extraction, site categorical linkage transforms, and loads into an instance of PostgreSQL"""
-    async with async_playwright() as p:
-        async with ClientSession() as session:
-            browser = await p.chromium.launch(headless=False)
-            all_clubs_df, all_players_df = await extract_main(browser, session)
-            df_pipeline = await transform_main(all_players_df, all_clubs_df, session)
-            load_main(df_pipeline.player_match_df, df_pipeline.club_match_df)
+def parse_args() -> argparse.Namespace:
+    """Parses driver options for checkpoints, resuming, the crawl config, the scraping progress journal and the squad cache"""
+    parser = argparse.ArgumentParser(description='Scrape, link and load team and player IDs across sites')
+    parser.add_argument('--checkpoint', action='store_true', help='write Parquet checkpoints at every stage boundary')
+    parser.add_argument('--checkpoint-dir', type=pathlib.Path, default=here, help='directory checkpoints are written to and read from')
+    parser.add_argument('--journal', type=pathlib.Path, help='record scraping progress here and reuse its successful units on rerun')
+    parser.add_argument('--crawl-config', type=pathlib.Path, help='TOML file of leagues, seasons, concurrency caps and time budget (see crawl.toml)')
+    parser.add_argument('--squad-cache', type=pathlib.Path, help='keep squad fingerprints and name matches here so unchanged clubs are skipped on rerun')
+    parser.add_argument('--json-decoder', choices=list(decoders), default='fast', help='decode JSON responses whole (orjson when installed) or stream only the fields parsers read (ijson)')
+    parser.add_argument('--sites', nargs='+', choices=list(plugins), help='scrape only these sites, then stop after extract since matching needs every site')
+    parser.add_argument('--browser-sites', nargs='+', choices=['fbref', 'understat'], default=[], help='scrape these sites in the browser instead of over http from their raw pages')
+    parser.add_argument('--transform-backend', choices=['pandas', 'polars'], default='pandas', help='run the transform site split, name maps, club name mapping and joins in pandas or as Polars query plans (same output; name matching and the team category remap stay in pandas)')
+    parser.add_argument('--sink', choices=['postgres', *sinks], default='postgres', help='load into PostgreSQL (configured from .env) or write the same tables to local files')
+    parser.add_argument('--incremental', action='store_true', help='upsert only the differences against the live PostgreSQL tables, keeping team and player IDs stable across runs')
+    parser.add_argument('--crosswalk', action='store_true', help='also rebuild the PostgreSQL crosswalk tables and wide player view in the load transaction')
+    parser.add_argument('--sink-path', type=pathlib.Path, help='file or directory the parquet, duckdb or sqlite sink writes, the sink default when omitted')
+    parser.add_argument('--resume-from', choices=list(Checkpoints.stages), help='start from a saved checkpoint instead of rerunning earlier stages')
+    parser.add_argument('--profile', type=pathlib.Path, help='profile CPU, allocations and event loop lag of each stage into this directory')
+    parser.add_argument('--metrics-dir', type=pathlib.Path, help='write metrics.prom and a trace.json of stage, request and parse timings here')
+    args = parser.parse_args()
+    if args.sink != 'postgres' and (args.incremental or args.crosswalk):
+        parser.error('--incremental and --crosswalk need the postgres sink')
+    return args
 
-if __name__ == "__main__":
-    asyncio.run(main())
+async def main(args: argparse.Namespace) -> None:
+    """Runs pipeline webscraping extraction, site categorical linkage transforms, and loads into an instance of PostgreSQL"""
+    if args.profile:
+        profiler.enable(args.profile)
+    try:
+        await run_pipeline(args)
+    finally:
+        if args.metrics_dir:
+            metrics.write(args.metrics_dir)
 
-            
+def create_loader(args: argparse.Namespace):
+    """Creates the PostgreSQL loader, or a file sink so the run needs no database
 
+    Incremental loads diff against the live tables, so they run once the players are handed over instead of overlapping the transform.
+    """
+    if args.sink != 'postgres':
+        return sinks[args.sink](path=args.sink_path)
+    from db import PgAsyncLoad, PgUpsertMatches # imported here so file sink runs don't need psycopg2
+    if args.incremental:
+        return PgUpsertMatches(crosswalk=args.crosswalk)
+    return PgAsyncLoad(crosswalk=args.crosswalk)
 
+async def run_pipeline(args: argparse.Namespace) -> None:
+    """Runs extract, transform and load, skipping stages resumed from checkpoints"""
+    checkpoints = Checkpoints(args.checkpoint_dir, args.resume_from) if args.checkpoint or args.resume_from else None
+    squads = SquadCache(args.squad_cache)
+    journal = ProgressJournal(args.journal)
+    crawl_config = load_config(args.crawl_config) if args.crawl_config else CrawlConfig()
+    scheduler = CrawlScheduler(crawl_config, journal)
+    selected = select(args.sites)
+    async with SiteSessions(scheduler) as sessions:
+        loader = None
+        try:
+            if checkpoints and checkpoints.resumes('matches'):
+                player_match_df, club_match_df = checkpoints.load('matches')
+                loader = create_loader(args)
+                loader.start()
+                loader.start_clubs(club_match_df)
+            else:
+                if checkpoints and checkpoints.resumes('extract'):
+                    all_clubs_df, all_players_df = checkpoints.load('extract')
+                else:
+                    from siteScrapers import extract_main # imported here so resumed runs skip the scraping modules
+                    async with launch_browser(selected, args.browser_sites) as browser:
+                        with pipeline_stage('extract'):
+                            all_clubs_df, all_players_df = await extract_main(browser, sessions, scheduler, squads, decoders[args.json_decoder](), args.browser_sites, selected)
+                    squads.save()
+                    failures = journal.failures()
+                    if failures:
+                        for unit, error in failures.items():
+                            print(f'{unit} failed -- {error}')
+                        print(f'{len(failures)} units failed, rerun with the same --journal to retry only those units')
+                        return
+                    if checkpoints:
+                        checkpoints.save('extract', all_clubs_df, all_players_df)
+                    if len(selected) < len(plugins):
+                        print(f'scraped {len(selected)} of {len(plugins)} sites, stopping before matching which needs every site')
+                        return
+                loader = create_loader(args) # started only once every site is scraped without failures, so failed and --sites runs never touch the load target
+                loader.start() # schema is created while sites are matched
+                from dfTransforms import transform_main
+                with metrics.span('stage', stage='transform'):
+                    df_pipeline = await transform_main(all_players_df, all_clubs_df, sessions.get('wikipedia'), loader, checkpoints, squads, args.transform_backend)
+                squads.save()
+                player_match_df = df_pipeline.player_match_df
+            with pipeline_stage('load'):
+                await loader.load_players(player_match_df)
+                build_index(player_match_df)
+        finally:
+            if loader:
+                await loader.close()
 
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
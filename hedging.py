@@ -0,0 +1,121 @@
+"""Per host latency tracking, adaptive timeouts and hedged duplicate requests for the aiohttp scrapers"""
+
+import asyncio
+import time
+from collections import defaultdict, deque
+from urllib.parse import urlparse
+from aiohttp import ClientSession
+from metrics import metrics
+
+class LatencyWindow:
+    """Latencies of a host's most recent requests"""
+    def __init__(self, size: int) -> None:
+        self.latencies = deque(maxlen=size)
+
+    def add(self, seconds: float) -> None:
+        self.latencies.append(seconds)
+
+    def percentile(self, q: float) -> float:
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class HedgedRequests:
+    """Times out and hedges requests from the latencies recently seen on their host
+
+    Once a host has min_samples latencies, a request still running after the host's hedge_quantile latency
+    is duplicated and whichever copy finishes first is used, as long as hedges stay under budget (a share of all
+    requests). Each copy is cut off after timeout_factor times the host's timeout_quantile latency, within
+    min_timeout and max_timeout. Timed out copies count as taking their timeout, so timeouts widen when a host slows down.
+    A first copy cancelled because its hedge won counts as taking as long as it ran, a lower bound of its latency, so
+    the slow requests hedging cuts short still push the hedge delay and timeouts up. Cancelled hedges aren't counted,
+    as they started late and their elapsed time says little about the host.
+
+    Keyword arguments:
+    hedge_quantile -- latency quantile after which a duplicate is sent
+    timeout_quantile -- latency quantile timeouts are derived from
+    timeout_factor -- multiple of the timeout quantile a request may take
+    min_timeout, max_timeout -- bounds of the adaptive timeout in seconds
+    budget -- most hedged duplicates as a share of requests
+    min_samples -- latencies needed before a host's requests are hedged or timed out
+    window -- latencies kept per host
+    """
+    def __init__(self, hedge_quantile: float = 0.95, timeout_quantile: float = 0.99, timeout_factor: float = 3, min_timeout: float = 5,
+                 max_timeout: float = 60, budget: float = 0.05, min_samples: int = 20, window: int = 200) -> None:
+        self.hedge_quantile = hedge_quantile
+        self.timeout_quantile = timeout_quantile
+        self.timeout_factor = timeout_factor
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.budget = budget
+        self.min_samples = min_samples
+        self.windows = defaultdict(lambda: LatencyWindow(window))
+        self.requests = 0
+        self.hedges = 0
+
+    def warmed_up(self, host: str) -> bool:
+        return len(self.windows[host].latencies) >= self.min_samples
+
+    def hedge_delay(self, host: str) -> float:
+        return self.windows[host].percentile(self.hedge_quantile) if self.warmed_up(host) else None
+
+    def timeout(self, host: str) -> float:
+        if not self.warmed_up(host):
+            return None
+        return min(self.max_timeout, max(self.min_timeout, self.timeout_factor * self.windows[host].percentile(self.timeout_quantile)))
+
+    def may_hedge(self) -> bool:
+        return self.hedges < self.budget * self.requests
+
+    async def timed(self, host: str, request, record_cancelled: bool = False):
+        """Runs one copy of a request under the host's timeout and records its latency, or its elapsed time if
+        it's cancelled and record_cancelled is set"""
+        timeout = self.timeout(host)
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(request(), timeout)
+        except asyncio.TimeoutError:
+            self.windows[host].add(time.perf_counter() - start)
+            metrics.inc('request_timeouts', host=host)
+            raise
+        except asyncio.CancelledError:
+            if record_cancelled:
+                self.windows[host].add(time.perf_counter() - start)
+            raise
+        self.windows[host].add(time.perf_counter() - start)
+        return result
+
+    async def first_result(self, attempts: list[asyncio.Task]):
+        """Returns the first copy to succeed, raising the first error if every copy fails"""
+        pending = set(attempts)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for attempt in done:
+                if attempt.exception() is None:
+                    return attempt.result()
+        return attempts[0].result()
+
+    async def run(self, host: str, request):
+        """Runs request (a function returning a coroutine), hedging it once it passes the host's tail latency"""
+        self.requests += 1
+        attempts = [asyncio.create_task(self.timed(host, request, record_cancelled=True))]
+        try:
+            done, _ = await asyncio.wait(attempts, timeout=self.hedge_delay(host))
+            if not done and self.may_hedge():
+                self.hedges += 1
+                metrics.inc('hedged_requests', host=host)
+                attempts.append(asyncio.create_task(self.timed(host, request)))
+            return await self.first_result(attempts)
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+
+    async def get(self, session: ClientSession, url: str, headers: dict, site: str, text: bool = False) -> tuple:
+        """GETs url, returning (status, response headers, body as bytes or as text), with no body for a 304"""
+        async def request():
+            async with session.get(url, headers=headers) as r:
+                metrics.inc('responses', site=site, status=r.status)
+                if r.status == 304:
+                    return r.status, r.headers, None
+                r.raise_for_status()
+                return r.status, r.headers, await (r.text() if text else r.read())
+        return await self.run(urlparse(url).netloc, request)
@@ -0,0 +1,140 @@
+"""Memory-mapped player ID index for vectorized translation of site IDs between sites
+
+The index file is written once at the end of the pipeline and mapped read-only on import,
+so any number of worker processes share the same pages instead of each loading a copy.
+
+File layout:
+magic -- b'FFDCIDX1'
+header length -- little endian uint64
+header -- JSON with the site names, row count and the offset/dtype/shape of each array
+arrays -- 64 byte aligned
+    strings -- sorted, interned site IDs as fixed width utf-8 bytes
+    codes_<site> -- per player row, position of the row's site ID in strings (-1 if missing)
+    sorted_<site> -- codes_<site> sorted, with IDs shared by several rows removed
+    rows_<site> -- player row of each entry of sorted_<site>
+"""
+
+import json
+import mmap
+import os
+import pathlib
+import numpy as np
+import pandas as pd
+from sinks import table_sites
+
+magic = b'FFDCIDX1'
+alignment = 64
+sites = table_sites
+index_path = pathlib.Path(os.getenv('ID_INDEX_PATH', pathlib.Path(__file__).parent / 'player_ids.idx'))
+
+def build_arrays(player_match_df: pd.DataFrame) -> dict[str, np.ndarray]:
+    """Interns every site ID of player_match_df and builds the sorted lookup columns of each site"""
+    site_ids = {site: player_match_df['id_' + site].astype(str).str.encode('utf-8').to_numpy(dtype=bytes) for site in sites}
+    missing = {site: player_match_df['id_' + site].isna().to_numpy() for site in sites}
+    strings = np.unique(np.concatenate(list(site_ids.values())))
+    arrays = {'strings': strings}
+    for site in sites:
+        codes = np.searchsorted(strings, site_ids[site]).astype(np.int32)
+        codes[missing[site]] = -1
+        rows = np.argsort(codes, kind='stable').astype(np.int32)
+        sorted_codes = codes[rows]
+        unique_codes, counts = np.unique(sorted_codes, return_counts=True)
+        keep = np.isin(sorted_codes, unique_codes[counts == 1]) & (sorted_codes >= 0)
+        arrays['codes_' + site] = codes
+        arrays['sorted_' + site] = sorted_codes[keep]
+        arrays['rows_' + site] = rows[keep]
+    return arrays
+
+def build_index(player_match_df: pd.DataFrame, path: pathlib.Path = index_path) -> None:
+    """Writes the index file for player_match_df, replacing any existing file atomically"""
+    arrays = build_arrays(player_match_df)
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = -(-offset // alignment) * alignment
+        layout[name] = {'offset': offset, 'dtype': array.dtype.str, 'shape': array.shape}
+        offset += array.nbytes
+    header = json.dumps({'sites': sites, 'rows': len(player_match_df), 'arrays': layout}).encode()
+    data_start = -(-(len(magic) + 8 + len(header)) // alignment) * alignment
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(magic)
+        f.write(len(header).to_bytes(8, 'little'))
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(data_start + layout[name]['offset'])
+            f.write(np.ascontiguousarray(array).tobytes())
+    os.replace(tmp_path, path)
+
+class IdIndex:
+    """Read-only, memory-mapped view of an index file"""
+    def __init__(self, path: pathlib.Path = index_path) -> None:
+        with open(path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.buffer[:len(magic)] != magic:
+            raise ValueError(f'{path} is not an ID index file')
+        header_len = int.from_bytes(self.buffer[len(magic):len(magic) + 8], 'little')
+        header = json.loads(self.buffer[len(magic) + 8:len(magic) + 8 + header_len])
+        data_start = -(-(len(magic) + 8 + header_len) // alignment) * alignment
+        self.sites = header['sites']
+        self.rows = header['rows']
+        self.arrays = {
+            name: np.frombuffer(
+                self.buffer,
+                dtype=np.dtype(spec['dtype']),
+                count=int(np.prod(spec['shape'])),
+                offset=data_start + spec['offset'],
+            )
+            for name, spec in header['arrays'].items()
+        }
+        self.strings = self.arrays['strings']
+
+    def intern(self, ids) -> np.ndarray:
+        """Finds the string table position of each ID (-1 if the ID isn't in the index)"""
+        keys = np.asarray(ids)
+        if keys.dtype.kind != 'S':
+            keys = keys.astype(str)
+            try:
+                keys = keys.astype(bytes) # fast path for ascii IDs
+            except UnicodeEncodeError:
+                keys = np.char.encode(keys, 'utf-8')
+        if not len(self.strings):
+            return np.full(len(keys), -1, dtype=np.int32)
+        codes = np.searchsorted(self.strings, keys).clip(max=len(self.strings) - 1)
+        found = self.strings[codes] == keys
+        if keys.dtype.itemsize > self.strings.dtype.itemsize: # longer keys compare equal to a truncated prefix
+            found &= np.char.str_len(keys) <= self.strings.dtype.itemsize
+        return np.where(found, codes, -1)
+
+    def rows_of(self, codes: np.ndarray, site: str) -> np.ndarray:
+        """Finds the player row holding each string code on the given site (-1 if none)"""
+        sorted_codes, rows = self.arrays['sorted_' + site], self.arrays['rows_' + site]
+        if not len(sorted_codes):
+            return np.full(len(codes), -1, dtype=np.int32)
+        pos = np.searchsorted(sorted_codes, codes).clip(max=len(sorted_codes) - 1)
+        found = (sorted_codes[pos] == codes) & (codes >= 0)
+        return np.where(found, rows[pos], -1)
+
+    def translate(self, ids, from_site: str, to_site: str) -> np.ndarray:
+        """Translates site IDs of from_site to the IDs of the same players on to_site (None where unknown)"""
+        for site in (from_site, to_site):
+            if site not in self.sites:
+                raise KeyError(f'Unknown site {site}')
+        rows = self.rows_of(self.intern(ids), from_site)
+        to_codes = np.where(rows >= 0, self.arrays['codes_' + to_site][rows], -1)
+        translated = np.full(len(to_codes), None, dtype=object)
+        found = to_codes >= 0
+        to_strings = self.strings[to_codes[found]]
+        try:
+            translated[found] = to_strings.astype(str) # fast path for ascii IDs
+        except UnicodeDecodeError:
+            translated[found] = np.char.decode(to_strings, 'utf-8')
+        return translated
+
+index = IdIndex(index_path) if index_path.exists() else None
+
+def translate(ids, from_site: str, to_site: str) -> np.ndarray:
+    """Translates site IDs between sites with the index mapped at import"""
+    if index is None:
+        raise FileNotFoundError(f'No ID index at {index_path}, run the pipeline or build_index first')
+    return index.translate(ids, from_site, to_site)
@@ -0,0 +1,238 @@
+"""Local HTTP service to translate loaded team and player IDs across sites"""
+
+import asyncio
+import os
+from collections import OrderedDict, defaultdict
+from aiohttp import web
+from psycopg2 import sql
+from db import BlockingConnectionPool, PgInitTables
+
+class CrosswalkIndex(PgInitTables):
+    """Class to hold an in-memory index of every site ID in the loaded tables
+
+    Site IDs shared by more than one row of a site table (e.g. soccerment's placeholder club ID) can't be
+    translated and are left out. IDs missing from the index fall back to Postgres, one query per batch over pooled
+    connections (waiting for a free one when all are in use). Fallback results, IDs not found included, are kept
+    in an LRU cache until the next reload, which every load triggers. The parent's connection listens for reload notifications.
+    """
+    def __init__(self, cache_size: int = 100_000, pool_size: int = 8) -> None:
+        """Calls init of parent to connect to the db, creates the lookup pool and defines the lookup queries"""
+        super().__init__()
+        self.pool = BlockingConnectionPool(1, pool_size, **self.db_params())
+        self.entities = {
+            'players': ('player_id', 'site_player_id'),
+            'teams': ('team_id', 'site_team_id'),
+        }
+        self.site_query = """
+            SELECT {id_col}, {site_id_col} FROM {site_table} WHERE {site_id_col} IS NOT NULL;
+        """
+        self.linked_query = """
+            SELECT found.{site_id_col}, found.{id_col}, linked.site, linked.site_id
+            FROM {site_table} AS found
+            JOIN ({linked_tables}) AS linked
+                ON linked.id = found.{id_col}
+            WHERE found.{site_id_col} = ANY(%s);
+        """
+        self.linked_table = """
+            SELECT {site_name} AS site, {id_col} AS id, {site_id_col} AS site_id FROM {site_table} WHERE {site_id_col} IS NOT NULL
+        """
+        self.by_site_id = {entity: {} for entity in self.entities}
+        self.by_id = {entity: {} for entity in self.entities}
+        self.cache_size = cache_size
+        self.fallbacks = OrderedDict()
+        self.reload_lock = asyncio.Lock()
+
+    def site_table_query(self, query: str, entity: str, site: str, **fields) -> sql.Composed:
+        """Formats a query against the site table of the given entity"""
+        id_col, site_id_col = self.entities[entity]
+        return sql.SQL(query).format(
+            id_col=sql.Identifier(id_col),
+            site_id_col=sql.Identifier(site_id_col),
+            site_table=sql.Identifier(f'{site}_{entity}'),
+            **fields,
+        )
+
+    def linked_table_query(self, entity: str, site: str) -> sql.Composed:
+        """Formats the query finding the rows of a batch of site IDs and the rows linked to them in every site table"""
+        linked_tables = sql.SQL(' UNION ALL ').join(
+            self.site_table_query(self.linked_table, entity, linked_site, site_name=sql.Literal(linked_site)) for linked_site in self.sites
+        )
+        return self.site_table_query(self.linked_query, entity, site, linked_tables=linked_tables)
+
+    def build(self) -> tuple[dict, dict]:
+        """Reads every site table on a fresh connection into site ID -> ID and ID -> site IDs lookups"""
+        by_site_id = {entity: {} for entity in self.entities}
+        by_id = {entity: {} for entity in self.entities}
+        conn = self.connect()
+        try:
+            with conn.cursor() as cur:
+                for entity in self.entities:
+                    for site in self.sites:
+                        cur.execute(self.site_table_query(self.site_query, entity, site))
+                        ambiguous = set()
+                        for id, site_id in cur:
+                            if (site, site_id) in by_site_id[entity]:
+                                ambiguous.add(site_id)
+                            by_site_id[entity][(site, site_id)] = id
+                            by_id[entity].setdefault(id, {})[site] = site_id
+                        for site_id in ambiguous:
+                            del by_site_id[entity][(site, site_id)]
+        finally:
+            conn.close()
+        return by_site_id, by_id
+
+    def reload(self) -> None:
+        """Rebuilds the index and swaps it in, clearing cached fallbacks"""
+        self.by_site_id, self.by_id = self.build()
+        self.fallbacks = OrderedDict()
+
+    def query_linked(self, entity: str, site: str, site_ids: list[str]) -> dict[str, tuple]:
+        """Looks up the ID and linked site IDs of a batch of site IDs directly in Postgres, in one query on a pooled connection"""
+        conn = self.pool.getconn()
+        try:
+            with conn, conn.cursor() as cur:
+                cur.execute(self.linked_table_query(entity, site), (site_ids,))
+                rows = cur.fetchall()
+        finally:
+            self.pool.putconn(conn)
+        rows_by_site_id = defaultdict(list)
+        for found_id, id, linked_site, linked_id in rows:
+            rows_by_site_id[found_id].append((id, linked_site, linked_id))
+        results = {}
+        for site_id in site_ids:
+            found = rows_by_site_id[site_id]
+            ids = {id for id, _, _ in found}
+            results[site_id] = (ids.pop(), {linked_site: linked_id for _, linked_site, linked_id in found}) if len(ids) == 1 else (None, None)
+        return results
+
+    def cached_fallback(self, entity: str, site: str, site_id: str) -> tuple:
+        """Gets a cached fallback result, None if the site ID hasn't been looked up since the last reload"""
+        key = (entity, site, site_id)
+        result = self.fallbacks.get(key)
+        if result is not None:
+            self.fallbacks.move_to_end(key)
+        return result
+
+    def cache_fallbacks(self, entity: str, site: str, results: dict[str, tuple]) -> None:
+        """Caches fallback results, found or not, evicting the least recently used beyond cache_size"""
+        for site_id, result in results.items():
+            self.fallbacks[(entity, site, site_id)] = result
+        while len(self.fallbacks) > self.cache_size:
+            self.fallbacks.popitem(last=False)
+
+    def lookup_memory(self, entity: str, site: str, site_id: str) -> tuple:
+        """Looks up the ID and linked site IDs of a site ID in the in-memory index"""
+        id = self.by_site_id[entity].get((site, site_id))
+        if id is None:
+            return None, None
+        return id, self.by_id[entity][id]
+
+    async def lookup_many(self, entity: str, site: str, site_ids: list[str]) -> list[tuple]:
+        """Looks up a batch of site IDs, resolving index misses through the fallback cache and then one Postgres query"""
+        results = [self.lookup_memory(entity, site, site_id) for site_id in site_ids]
+        misses = defaultdict(list)
+        for i, (id, _) in enumerate(results):
+            if id is None:
+                cached = self.cached_fallback(entity, site, site_ids[i])
+                if cached is None:
+                    misses[site_ids[i]].append(i)
+                else:
+                    results[i] = cached
+        if misses:
+            fallbacks = await asyncio.to_thread(self.query_linked, entity, site, list(misses))
+            self.cache_fallbacks(entity, site, fallbacks)
+            for site_id, positions in misses.items():
+                for i in positions:
+                    results[i] = fallbacks[site_id]
+        return results
+
+    def on_notify(self) -> None:
+        """Schedules a reload when a load signals that new data has been committed"""
+        self.conn.poll()
+        if self.conn.notifies:
+            self.conn.notifies.clear()
+            asyncio.create_task(self.hot_reload())
+
+    async def hot_reload(self) -> None:
+        """Reloads the index in a worker thread, one reload at a time"""
+        async with self.reload_lock:
+            await asyncio.to_thread(self.reload)
+
+    def listen(self) -> None:
+        """Listens for reload notifications sent by db.load_main and the db loaders"""
+        self.conn.autocommit = True
+        with self.conn.cursor() as cur:
+            cur.execute('LISTEN crosswalk_reload;')
+        asyncio.get_running_loop().add_reader(self.conn.fileno(), self.on_notify)
+
+    def close(self) -> None:
+        """Stops listening and closes the listening connection and the lookup pool"""
+        asyncio.get_running_loop().remove_reader(self.conn.fileno())
+        self.conn.close()
+        self.pool.closeall()
+
+class IdService:
+    """Serves cross-site ID lookups from a CrosswalkIndex
+
+    Routes:
+    GET /{entity}/{site}/{site_id} -- ID and every linked site ID of a site ID
+    POST /{entity}/translate -- {"from": site, "to": site, "ids": [...]} translated in order, null where unknown
+    POST /reload -- rebuilds the index
+    """
+    def __init__(self, index: CrosswalkIndex) -> None:
+        self.index = index
+
+    def check_path(self, entity: str, *sites: str) -> None:
+        if entity not in self.index.entities:
+            raise web.HTTPNotFound(text=f'Unknown entity {entity}')
+        for site in sites:
+            if site not in self.index.sites:
+                raise web.HTTPNotFound(text=f'Unknown site {site}')
+
+    async def linked(self, request: web.Request) -> web.Response:
+        entity, site, site_id = request.match_info['entity'], request.match_info['site'], request.match_info['site_id']
+        self.check_path(entity, site)
+        [(id, linked)] = await self.index.lookup_many(entity, site, [site_id])
+        if id is None:
+            raise web.HTTPNotFound(text=f'No {entity} with {site} ID {site_id}')
+        return web.json_response({'id': id, 'ids': linked})
+
+    async def translate(self, request: web.Request) -> web.Response:
+        entity = request.match_info['entity']
+        try:
+            body = await request.json()
+            from_site, to_site, ids = body['from'], body['to'], body['ids']
+        except (ValueError, KeyError, TypeError):
+            raise web.HTTPBadRequest(text='Expected a JSON object with from, to and ids')
+        if not isinstance(ids, list):
+            raise web.HTTPBadRequest(text='Expected ids to be a list')
+        self.check_path(entity, from_site, to_site)
+        site_ids = [str(site_id) for site_id in ids]
+        results = await self.index.lookup_many(entity, from_site, site_ids)
+        return web.json_response({'ids': [linked.get(to_site) if linked else None for _, linked in results]})
+
+    async def reload(self, request: web.Request) -> web.Response:
+        await self.index.hot_reload()
+        return web.json_response({'reloaded': True})
+
+    async def on_startup(self, app: web.Application) -> None:
+        await asyncio.to_thread(self.index.reload)
+        self.index.listen()
+
+    async def on_cleanup(self, app: web.Application) -> None:
+        self.index.close()
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.add_routes([
+            web.post('/reload', self.reload),
+            web.post('/{entity}/translate', self.translate),
+            web.get('/{entity}/{site}/{site_id}', self.linked),
+        ])
+        app.on_startup.append(self.on_startup)
+        app.on_cleanup.append(self.on_cleanup)
+        return app
+
+if __name__ == "__main__":
+    service = IdService(CrosswalkIndex())
+    web.run_app(service.app(), host='127.0.0.1', port=int(os.getenv('ID_SERVICE_PORT', 8080)))
@@ -0,0 +1,97 @@
+"""Pluggable decoders for JSON API responses
+
+JsonDecoder decodes whole responses with orjson when it's installed, falling back to the json module.
+ProjectingJsonDecoder streams responses through ijson and only builds the fields a site's parser reads,
+declared per site as a projection:
+    None -- keep the whole value
+    {key: projection} -- keep only these keys of an object, '*' standing for any key
+    [projection] -- apply the projection to every item of an array
+Scalars are always kept, so arrays mixing scalars and containers (like fotmob's [position, players]) project cleanly.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+skip = object() # projection of values left out
+
+def key_projection(projection, key):
+    if projection is None:
+        return None
+    if key in projection:
+        return projection[key]
+    return projection.get('*', skip)
+
+def project_events(events, projection):
+    """Builds the projected value from ijson parse events, skipping the events of every value left out"""
+    root = None
+    stack = [] # [container, projection of its items, projection of the next value, key of the next value]
+    skipping = 0
+    for _, event, value in events:
+        if skipping:
+            if event in ('start_map', 'start_array'):
+                skipping += 1
+            elif event in ('end_map', 'end_array'):
+                skipping -= 1
+            continue
+        if event == 'map_key':
+            stack[-1][2] = key_projection(stack[-1][1], value)
+            stack[-1][3] = value
+            continue
+        if event in ('end_map', 'end_array'):
+            stack.pop()
+            continue
+        value_projection = stack[-1][2] if stack else projection
+        if value_projection is skip:
+            if event in ('start_map', 'start_array'):
+                skipping = 1
+            continue
+        if event == 'start_map':
+            item = {}
+            item_projection = value_projection if isinstance(value_projection, dict) else None
+        elif event == 'start_array':
+            item = []
+            item_projection = value_projection[0] if isinstance(value_projection, list) else None
+        else:
+            item = value
+        if not stack:
+            root = item
+        elif isinstance(stack[-1][0], list):
+            stack[-1][0].append(item)
+        else:
+            stack[-1][0][stack[-1][3]] = item
+        if event in ('start_map', 'start_array'):
+            stack.append([item, item_projection, item_projection, None])
+    return root
+
+class JsonDecoder:
+    """Decodes whole responses, with orjson when installed"""
+    name = 'orjson' if orjson else 'json'
+
+    def decode(self, body: bytes, projection=None):
+        if orjson:
+            return orjson.loads(body)
+        return json.loads(body)
+
+class ProjectingJsonDecoder(JsonDecoder):
+    """Streams responses through ijson and builds only the declared projection of each,
+    falling back to a whole decode when there's no projection or ijson isn't installed"""
+    name = 'ijson'
+
+    def decode(self, body: bytes, projection=None):
+        if projection is None or ijson is None:
+            return super().decode(body)
+        return project_events(ijson.parse(body, use_float=True), projection)
+
+decoders = {
+    'fast': JsonDecoder,
+    'stream': ProjectingJsonDecoder,
+}
@@ -0,0 +1,109 @@
+"""Timing spans, counters and gauges collected over a pipeline run
+
+Spans are exported as a Chrome trace event JSON file (open in chrome://tracing or https://ui.perfetto.dev)
+and summarized with the counters and gauges in a Prometheus text format file.
+"""
+
+import asyncio
+import json
+import os
+import pathlib
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+class Metrics:
+    """Collects timing spans, counters and gauges keyed by name and labels"""
+    prefix = 'ffdc'
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.spans = []
+        self.counters = defaultdict(float)
+        self.gauges = {}
+        self.task_ids = {}
+
+    def label_key(self, labels: dict) -> tuple:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def track_id(self) -> int:
+        """Numbers each asyncio task so concurrent spans are drawn on separate trace tracks"""
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        return self.task_ids.setdefault(id(task), len(self.task_ids))
+
+    @contextmanager
+    def span(self, name: str, **labels):
+        """Times the enclosed block (sync or async) as a span"""
+        track = self.track_id()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append((name, labels, start - self.start, time.perf_counter() - start, track))
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        self.counters[(name, self.label_key(labels))] += value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        self.gauges[(name, self.label_key(labels))] = value
+
+    def format_labels(self, label_key: tuple) -> str:
+        if not label_key:
+            return ''
+        pairs = []
+        for key, value in label_key:
+            value = value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            pairs.append(f'{key}="{value}"')
+        return '{' + ','.join(pairs) + '}'
+
+    def prometheus_text(self) -> str:
+        """Formats counters, gauges and per label span count/sum/max in Prometheus text format"""
+        lines = []
+        for kind, values, suffix in (('counter', self.counters, '_total'), ('gauge', self.gauges, '')):
+            for name in sorted({name for name, _ in values}):
+                lines.append(f'# TYPE {self.prefix}_{name}{suffix} {kind}')
+                for (value_name, label_key), value in sorted(values.items()):
+                    if value_name == name:
+                        lines.append(f'{self.prefix}_{name}{suffix}{self.format_labels(label_key)} {value:g}')
+        span_stats = defaultdict(list)
+        for name, labels, _, duration, _ in self.spans:
+            span_stats[(name, self.label_key(labels))].append(duration)
+        for name in sorted({name for name, _ in span_stats}):
+            lines.append(f'# TYPE {self.prefix}_{name}_seconds summary')
+            for (span_name, label_key), durations in sorted(span_stats.items()):
+                if span_name == name:
+                    labels = self.format_labels(label_key)
+                    lines.append(f'{self.prefix}_{name}_seconds_count{labels} {len(durations)}')
+                    lines.append(f'{self.prefix}_{name}_seconds_sum{labels} {sum(durations):.6f}')
+                    lines.append(f'{self.prefix}_{name}_seconds_max{labels} {max(durations):.6f}')
+        return '\n'.join(lines) + '\n'
+
+    def trace(self) -> dict:
+        """Formats spans as complete events of the Chrome trace event format"""
+        pid = os.getpid()
+        events = [
+            {
+                'name': labels.get('stage') or labels.get('site') or name,
+                'cat': name,
+                'ph': 'X',
+                'ts': round(start * 1e6),
+                'dur': round(duration * 1e6),
+                'pid': pid,
+                'tid': track,
+                'args': {key: str(value) for key, value in labels.items()},
+            }
+            for name, labels, start, duration, track in self.spans
+        ]
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write(self, path: pathlib.Path) -> None:
+        """Writes metrics.prom and trace.json to the given directory"""
+        path = pathlib.Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        (path / 'metrics.prom').write_text(self.prometheus_text())
+        (path / 'trace.json').write_text(json.dumps(self.trace()))
+
+metrics = Metrics()
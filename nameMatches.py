@@ -6,9 +6,25 @@ from bs4 import BeautifulSoup
 from thefuzz import fuzz, process
 import pandas as pd
 import time
+from collections import Counter, defaultdict
+from metrics import metrics
 
-class ClubMatchesBySite:
+class MatchStageMetrics:
+    """Match stage metrics shared by the name matchers, which need entity, site_names and match_rows"""
+    def filled_slots(self, match_rows: list[dict]) -> int:
+        """Counts the site matches already stored across match rows"""
+        return sum(match_row[site_name] is not None for match_row in match_rows for site_name in self.site_names)
+
+    def record_stage_metrics(self, stage: str, filled_before: int) -> None:
+        """Records site matches found (hits) and still missing (misses) by a match stage"""
+        filled_after = self.filled_slots(self.match_rows)
+        metrics.inc('match_hits', filled_after - filled_before, entity=self.entity, stage=stage)
+        metrics.inc('match_misses', len(self.match_rows) * len(self.site_names) - filled_after, entity=self.entity, stage=stage)
+
+class ClubMatchesBySite(MatchStageMetrics):
     """Facilitates inter-site name matching to appropriately link naming discrepancies for clubs"""
+    entity = 'club'
+
     def __init__(self, clubs_by_site):
         self.clubs_by_site = clubs_by_site
         self.site_names = ['transfermrkt', 'fotmob', 'fbref', 'understat', 'whoscored', 'soccerment', 'capology']
@@ -83,7 +99,10 @@ class ClubMatchesBySite:
     def match_stage_sync(self, func) -> None:
         """Runs a synchronous match stage and the match stage helpers"""
         current_match_rows = self.match_rows
-        self.match_rows = [func(match_row) for match_row in current_match_rows]
+        filled_before = self.filled_slots(current_match_rows)
+        with metrics.span('match_stage', entity=self.entity, stage=func.__name__):
+            self.match_rows = [func(match_row) for match_row in current_match_rows]
+        self.record_stage_metrics(func.__name__, filled_before)
         self.store_full_matches()
         self.remaining_match_rows()
 
@@ -104,8 +123,10 @@ class ClubMatchesBySite:
         self.apply_match_stages_sync(sync_match_funcs)
         return pd.DataFrame(self.full_matches)
 
-class PlayerMatchesBySite:
+class PlayerMatchesBySite(MatchStageMetrics):
     """Facilitates inter-site name matching to appropriately link naming discrepancies for players on a given team"""
+    entity = 'player'
+
     def __init__(self, players_by_site: list[pd.DataFrame], team_name: str, session: ClientSession) -> None:
         self.players_by_site = players_by_site
         self.team_name = team_name
@@ -166,7 +187,7 @@ class PlayerMatchesBySite:
         return match_row
 
     async def wiki_search(self, match_row: dict) -> str:
-        """Makes GET request to wiki API to extract key for the player page"""
+        """Makes GET request to wiki API to extract key for the player page, None when it times out"""
         try:
             name_team = match_row['fotmob'] + ' ' + self.team_name
             search_url = f'https://en.wikipedia.org/w/rest.php/v1/search/page?q={name_team}&limit=1'
@@ -178,6 +199,8 @@ class PlayerMatchesBySite:
         except ClientResponseError:
             time.sleep(5)
             return await self.wiki_search(match_row)
+        except asyncio.TimeoutError:
+            return None
 
     async def wiki_names(self, match_row: dict) -> list:
         """Using player page key, makes GET request to wiki API to extract alternative names"""
@@ -196,6 +219,8 @@ class PlayerMatchesBySite:
         except ClientResponseError:
             time.sleep(5)
             return await self.wiki_names(match_row)
+        except asyncio.TimeoutError:
+            return None
 
     async def wiki_name_match(self, match_row: dict) -> dict:
         """Stores matches that have the highest fuzzy match ratio w/ wiki alternative names"""
@@ -217,7 +242,10 @@ class PlayerMatchesBySite:
     def match_stage_sync(self, func) -> None:
         """Runs a synchronous match stage and the match stage helpers"""
         current_match_rows = self.match_rows
-        self.match_rows = [func(match_row) for match_row in current_match_rows]
+        filled_before = self.filled_slots(current_match_rows)
+        with metrics.span('match_stage', entity=self.entity, stage=func.__name__):
+            self.match_rows = [func(match_row) for match_row in current_match_rows]
+        self.record_stage_metrics(func.__name__, filled_before)
         self.store_full_matches()
         self.remaining_match_rows()
 
@@ -230,8 +258,11 @@ class PlayerMatchesBySite:
     async def match_stage_async(self, func) -> None:
         """Runs an asynchronous match stages and the match stage helpers"""
         current_match_rows = self.match_rows
+        filled_before = self.filled_slots(current_match_rows)
         match_tasks = [func(match_row) for match_row in current_match_rows]
-        self.match_rows = await asyncio.gather(*match_tasks)
+        with metrics.span('match_stage', entity=self.entity, stage=func.__name__):
+            self.match_rows = await asyncio.gather(*match_tasks)
+        self.record_stage_metrics(func.__name__, filled_before)
         self.store_full_matches()
         self.remaining_match_rows()
 
@@ -254,4 +285,74 @@ class PlayerMatchesBySite:
         self.apply_match_stages_sync(sync_match_funcs)
         await self.apply_match_stages_async(async_match_funcs)
         rows_with_team = [self.add_team_name(match_row) for match_row in self.full_matches]
-        return pd.DataFrame(rows_with_team)
\ No newline at end of file
+        return pd.DataFrame(rows_with_team)
+
+class TrigramIndex:
+    """Inverted index from the character trigrams of names to the names containing them,
+    so fuzzy match candidates are found without scoring every pair of names"""
+    def __init__(self, names: list[str]) -> None:
+        self.names = names
+        self.postings = defaultdict(list)
+        for i, name in enumerate(names):
+            for gram in self.grams(name):
+                self.postings[gram].append(i)
+
+    def grams(self, name: str) -> set[str]:
+        padded = f'  {name} '
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def candidates(self, name: str, limit: int = 5, min_shared: float = 0.3) -> list[int]:
+        """Gets the indexes of the names sharing the most trigrams with name, at least min_shared of them"""
+        grams = self.grams(name)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+        return [i for i, count in shared.most_common(limit) if count >= min_shared * len(grams)]
+
+class CrossClubMatchesBySite:
+    """Matches players left unmatched by the club by club stages against every leftover player of their league,
+    linking players listed under different clubs on different sites (e.g. after a mid-season transfer)
+
+    Candidates come from a trigram index of each site's leftover names and are confirmed by fuzzy match ratio,
+    with a stricter cutoff for candidates listed at another club. Only players matched on every site are kept.
+    """
+    entity = 'player'
+
+    def __init__(self, fm_players: list[tuple], players_by_site: dict[str, list[tuple]], same_club_cutoff: int = 80, other_club_cutoff: int = 90) -> None:
+        """Takes (processed name, team) pairs of leftover fotmob players and of each other site's leftover players"""
+        self.fm_players = fm_players
+        self.players_by_site = players_by_site
+        self.same_club_cutoff = same_club_cutoff
+        self.other_club_cutoff = other_club_cutoff
+
+    def cutoff(self, fm_player: tuple, player: tuple) -> int:
+        return self.same_club_cutoff if fm_player[1] == player[1] else self.other_club_cutoff
+
+    def site_matches(self, players: list[tuple]) -> dict[int, tuple]:
+        """Links fotmob players to a site's players, taking the best scoring unambiguous pairs first"""
+        index = TrigramIndex([player[0] for player in players])
+        scored = []
+        for fm_i, fm_player in enumerate(self.fm_players):
+            scores = sorted(((fuzz.ratio(fm_player[0], players[i][0]), i) for i in index.candidates(fm_player[0])), reverse=True)
+            scores = [(score, i) for score, i in scores if score >= self.cutoff(fm_player, players[i])]
+            if scores and (len(scores) == 1 or scores[0][0] > scores[1][0]):
+                scored.append((scores[0][0], fm_i, scores[0][1]))
+        matches, used = {}, set()
+        for _, fm_i, i in sorted(scored, reverse=True):
+            if fm_i not in matches and i not in used:
+                matches[fm_i] = players[i]
+                used.add(i)
+        return matches
+
+    def main(self) -> list[dict]:
+        """Returns a {site: (processed name, team)} row, fotmob included, for each player matched on every site"""
+        if not self.fm_players:
+            return []
+        with metrics.span('match_stage', entity=self.entity, stage='cross_club'):
+            matches_by_site = {site_name: self.site_matches(players) for site_name, players in self.players_by_site.items()}
+        rows = []
+        for fm_i, fm_player in enumerate(self.fm_players):
+            if all(fm_i in matches for matches in matches_by_site.values()):
+                rows.append({'fotmob': fm_player} | {site_name: matches[fm_i] for site_name, matches in matches_by_site.items()})
+        metrics.inc('match_hits', len(rows) * len(self.players_by_site), entity=self.entity, stage='cross_club')
+        return rows
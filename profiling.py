@@ -0,0 +1,123 @@
+"""Opt-in CPU, allocation and event loop lag profiling of pipeline stages"""
+
+import asyncio
+import cProfile
+import io
+import pathlib
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+from metrics import metrics
+
+class StageProfiler:
+    """Profiles each pipeline stage with cProfile and tracemalloc while sampling asyncio event loop lag
+
+    Disabled until enable() is called. Each stage writes <n>_<stage>.prof (readable with pstats or snakeviz)
+    and appends its top functions, biggest allocations and loop lag to summary.txt. Loop lag is sampled
+    while a stage runs on the event loop, so it catches blocking parses or time.sleep calls inside async stages.
+    Nested stages are profiled as part of the outermost one.
+    """
+    def __init__(self) -> None:
+        self.path = None
+        self.active = False
+        self.stage_count = 0
+
+    def enable(self, path: pathlib.Path, top: int = 15, lag_interval: float = 0.05, frames: int = 10) -> None:
+        """Turns profiling on, writing profiles and the summary to the given directory"""
+        self.path = pathlib.Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        (self.path / 'summary.txt').write_text('')
+        self.top = top
+        self.lag_interval = lag_interval
+        self.frames = frames
+
+    async def monitor_lag(self, lag: dict) -> None:
+        """Sleeps for a fixed interval in a loop, recording how late each wake up is"""
+        while True:
+            lag['since'] = time.perf_counter()
+            await asyncio.sleep(self.lag_interval)
+            lag['samples'].append(time.perf_counter() - lag['since'] - self.lag_interval)
+
+    def start_lag_monitor(self, lag: dict):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+        return loop.create_task(self.monitor_lag(lag))
+
+    def stop_lag_monitor(self, task, lag: dict) -> None:
+        if task is None:
+            return
+        task.cancel()
+        if 'since' in lag: # a wake up still pending when the stage ends was held up by the stage itself
+            pending = time.perf_counter() - lag['since'] - self.lag_interval
+            if pending > 0:
+                lag['samples'].append(pending)
+
+    def lag_summary(self, samples: list[float]) -> str:
+        if not samples:
+            return 'event loop lag: not sampled (stage ran without yielding to the event loop)'
+        ordered = sorted(samples)
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        return (f'event loop lag: {len(ordered)} samples, mean {sum(ordered) / len(ordered) * 1000:.1f}ms, '
+                f'p95 {p95 * 1000:.1f}ms, max {ordered[-1] * 1000:.1f}ms')
+
+    def write_stage(self, name: str, duration: float, profile: cProfile.Profile, snapshot: tracemalloc.Snapshot, peak: int, lag_samples: list[float]) -> None:
+        """Dumps a stage's profile and appends its summary"""
+        self.stage_count += 1
+        profile.dump_stats(self.path / f'{self.stage_count:02d}_{name}.prof')
+        functions = io.StringIO()
+        pstats.Stats(profile, stream=functions).sort_stats('cumulative').print_stats(self.top)
+        allocations = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ]).statistics('lineno')[:self.top]
+        lines = [
+            f'=== {name} ===',
+            f'duration: {duration:.3f}s',
+            f'peak traced memory: {peak / 2 ** 20:.1f}MiB',
+            self.lag_summary(lag_samples),
+            f'top {self.top} allocations:',
+            *(f'  {stat}' for stat in allocations),
+            f'top {self.top} functions by cumulative time:',
+            functions.getvalue().strip(),
+            '',
+        ]
+        with open(self.path / 'summary.txt', 'a') as f:
+            f.write('\n'.join(lines) + '\n')
+        if lag_samples:
+            metrics.set('event_loop_lag_max_seconds', max(lag_samples), stage=name)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Profiles the enclosed block (sync or async) as a pipeline stage when profiling is enabled"""
+        if self.path is None or self.active:
+            yield
+            return
+        self.active = True
+        lag = {'samples': []}
+        lag_task = self.start_lag_monitor(lag)
+        tracemalloc.start(self.frames)
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            duration = time.perf_counter() - start
+            self.stop_lag_monitor(lag_task, lag)
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.active = False
+            self.write_stage(name, duration, profile, snapshot, peak, lag['samples'])
+
+profiler = StageProfiler()
+
+@contextmanager
+def pipeline_stage(name: str):
+    """Times a pipeline stage as a metrics span and profiles it when profiling is enabled"""
+    with metrics.span('stage', stage=name), profiler.stage(name):
+        yield
@@ -0,0 +1,85 @@
+"""Journal of scraping unit outcomes so reruns only retry the units that failed"""
+
+import json
+import pathlib
+from dataclasses import asdict
+from idObjects import ClubData, PlayerData
+
+record_types = {
+    'ClubData': ClubData,
+    'PlayerData': PlayerData,
+}
+
+class ProgressJournal:
+    """Records the results of successful scraping units and the errors of failed ones
+
+    Units are a league's club list, a club's squad, or a whole site, keyed as '<site>|<kind>|<unit>'.
+    Outcomes are appended to a JSON lines file (the last line of a unit wins), so a rerun with the same
+    journal reuses every successful unit and only retries failures. Without a path the journal is in-memory.
+    """
+    def __init__(self, path: pathlib.Path = None) -> None:
+        self.path = pathlib.Path(path) if path else None
+        self.units = {}
+        if self.path and self.path.exists():
+            with open(self.path) as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self.units[entry['key']] = entry
+
+    def key(self, site: str, kind: str, unit: str) -> str:
+        return f'{site}|{kind}|{unit}'
+
+    def encode(self, result) -> list:
+        """Converts a list of id objects (or a tuple of lists of them) to JSON compatible lists"""
+        if isinstance(result, tuple):
+            return [self.encode(part) for part in result]
+        return [{'type': type(record).__name__, **asdict(record)} for record in result]
+
+    def decode(self, value: list):
+        """Converts encoded results back to id objects"""
+        if value and isinstance(value[0], list):
+            return tuple(self.decode(part) for part in value)
+        return [record_types[record['type']](**{k: v for k, v in record.items() if k != 'type'}) for record in value]
+
+    def append(self, entry: dict) -> None:
+        self.units[entry['key']] = entry
+        if self.path:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+
+    def record_success(self, key: str, result) -> None:
+        self.append({'key': key, 'ok': True, 'result': self.encode(result)})
+
+    def record_failure(self, key: str, error: BaseException) -> None:
+        self.append({'key': key, 'ok': False, 'error': f'{type(error).__name__}: {error}'})
+
+    def succeeded(self, key: str) -> bool:
+        return self.units.get(key, {}).get('ok', False)
+
+    def failures(self) -> dict[str, str]:
+        """Retrieves the error of every unit whose latest outcome is a failure"""
+        return {key: entry['error'] for key, entry in self.units.items() if not entry['ok']}
+
+    async def run(self, site: str, kind: str, unit: str, fetch, default=None):
+        """Returns a unit's journaled result if it already succeeded, otherwise runs fetch and records the outcome
+
+        Keyword arguments:
+        fetch -- coroutine function scraping the unit
+        default -- result returned when the unit fails (an empty list if not given)
+        """
+        key = self.key(site, kind, unit)
+        if self.succeeded(key):
+            return self.decode(self.units[key]['result'])
+        try:
+            result = await fetch()
+        except Exception as e:
+            self.record_failure(key, e)
+            return [] if default is None else default
+        self.record_success(key, result)
+        return result
+
+    def clear_failure(self, site: str) -> None:
+        """Records that a whole site task completed, replacing an earlier site level failure"""
+        key = self.key(site, 'site', 'main')
+        if key in self.units and not self.units[key]['ok']:
+            self.append({'key': key, 'ok': True, 'result': []})
@@ -0,0 +1,269 @@
+"""Output sinks that write the matched player and team dataframes in the relational layout of the PostgreSQL tables
+
+Every sink writes the same tables: teams and players keyed by the row index of club_match_df and player_match_df,
+and per site <site>_teams and <site>_players tables keyed by those IDs. db.PgInsertMatches and its subclasses load
+them into PostgreSQL; the sinks here bulk write them to local files, for runs and consumers without a database.
+"""
+
+import abc
+import asyncio
+import os
+import pathlib
+import shutil
+import sqlite3
+import pandas as pd
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# site suffixes of the match dataframe columns and of the site tables, shared by every loader and the ID index
+table_sites = [
+    'transfermrkt',
+    'sofascore',
+    'fbref',
+    'understat',
+    'whoscored',
+    'soccerment',
+    'capology',
+    'fotmob',
+]
+
+class MatchSink(abc.ABC):
+    """Builds the rows of every table from player_match_df and club_match_df
+
+    Sinks are also loaders for the driver: start, start_clubs and load_players take the dataframes as the
+    pipeline produces them, and by default the whole load runs once the players are handed over.
+    """
+    sites = table_sites
+    site_table_columns = {
+        '_teams': ['team_id', 'site_name', 'site_team_id', 'site_url'],
+        '_players': ['player_id', 'site_player_name', 'site_player_id', 'site_url'],
+    }
+
+    def __init__(self, player_match_df: pd.DataFrame = None, club_match_df: pd.DataFrame = None) -> None:
+        self.player_match_df = player_match_df
+        self.club_match_df = club_match_df
+
+    def team_rows(self) -> pd.DataFrame:
+        """Builds base team table rows (ID is row index of club_match_df)"""
+        return pd.DataFrame({
+            'team_id': self.club_match_df.index,
+            'name': self.club_match_df['name_sofascore'].values,
+        })
+
+    def player_rows(self) -> pd.DataFrame:
+        """Builds base player table rows, resolving team IDs with a single join on the sofascore team name"""
+        team_ids = (self.club_match_df[['name_sofascore']]
+                        .rename_axis('team_id')
+                        .reset_index()
+                        .drop_duplicates(subset='name_sofascore')
+                        .rename(columns={'name_sofascore': 'team_sofascore'}))
+        players = (self.player_match_df[['name_fotmob', 'team_sofascore']]
+                        .rename_axis('player_id')
+                        .reset_index()
+                        .merge(team_ids, on='team_sofascore', how='left'))
+        return pd.DataFrame({
+            'player_id': players['player_id'],
+            'name': players['name_fotmob'],
+            'team_id': players['team_id'].astype('Int64'),
+        })
+
+    def site_columns(self, df: pd.DataFrame, site: str) -> list:
+        """Determines the name, id and url columns specific to the given site"""
+        return list(filter(lambda x: x.endswith(site) and x.split('_')[0] not in ['league', 'team', 'site'], df.columns))
+
+    def site_rows(self, df: pd.DataFrame, site: str) -> pd.DataFrame:
+        """Builds site table rows keyed by the row index of the given dataframe"""
+        return df[self.site_columns(df, site)].reset_index()
+
+    def table_rows(self) -> dict[str, pd.DataFrame]:
+        """Builds the rows of every table, in foreign key dependency order"""
+        tables = {'teams': self.team_rows()}
+        tables.update({site + '_teams': self.site_rows(self.club_match_df, site) for site in self.sites})
+        tables['players'] = self.player_rows()
+        tables.update({site + '_players': self.site_rows(self.player_match_df, site) for site in self.sites})
+        return tables
+
+    def typed_rows(self) -> dict[str, pd.DataFrame]:
+        """Builds the rows of every table with the column names of the PostgreSQL tables, casting site values
+        to strings as scraped ID columns mix ints and strings across sites"""
+        tables = self.table_rows()
+        for site in self.sites:
+            for site_type, columns in self.site_table_columns.items():
+                rows = tables[site + site_type].set_axis(columns, axis=1)
+                tables[site + site_type] = rows.astype({col: 'string' for col in columns[1:]})
+        return tables
+
+    @abc.abstractmethod
+    def run(self) -> None:
+        """Writes every table"""
+
+    def start(self) -> None:
+        pass
+
+    def start_clubs(self, club_match_df: pd.DataFrame) -> None:
+        self.club_match_df = club_match_df
+
+    async def load_players(self, player_match_df: pd.DataFrame) -> None:
+        self.player_match_df = player_match_df
+        await asyncio.to_thread(self.run)
+
+    async def close(self) -> None:
+        pass
+
+class FileSink(MatchSink):
+    """Sink writing to a local path, replaced on every run like the dropped and recreated PostgreSQL tables
+
+    The load is written to a staging path next to it and swapped in, so readers never see a partial load and a failed
+    run keeps the previous one. Single file loads are swapped in with one atomic os.replace.
+    """
+    default_path = None
+
+    def __init__(self, player_match_df: pd.DataFrame = None, club_match_df: pd.DataFrame = None, path: pathlib.Path = None) -> None:
+        super().__init__(player_match_df, club_match_df)
+        self.path = pathlib.Path(path or self.default_path)
+
+    def staging_path(self) -> pathlib.Path:
+        return self.path.with_name(self.path.name + '.tmp')
+
+    def remove(self, path: pathlib.Path) -> None:
+        if path.is_dir():
+            shutil.rmtree(path)
+        else:
+            path.unlink(missing_ok=True)
+
+    @abc.abstractmethod
+    def write(self, staging: pathlib.Path, tables: dict[str, pd.DataFrame]) -> None:
+        """Writes the tables to the staging path"""
+
+    def swap_in(self, staging: pathlib.Path) -> None:
+        os.replace(staging, self.path)
+
+    def run(self) -> None:
+        staging = self.staging_path()
+        self.remove(staging)
+        self.write(staging, self.typed_rows())
+        self.swap_in(staging)
+
+class ParquetSink(FileSink):
+    """Writes teams.parquet and players.parquet, and the site tables as site_teams and site_players datasets
+    partitioned by site (site=<site> directories), so readers filtering on one site only open its files
+
+    A directory can't be replaced atomically, so the previous load is renamed aside, the staged one renamed into
+    place and only then the previous one deleted: the path is missing only between the two renames.
+    """
+    default_path = 'crosswalk_parquet'
+
+    def old_path(self) -> pathlib.Path:
+        return self.path.with_name(self.path.name + '.old')
+
+    def swap_in(self, staging: pathlib.Path) -> None:
+        old = self.old_path()
+        self.remove(old)
+        if self.path.exists():
+            self.path.rename(old)
+        staging.rename(self.path)
+        self.remove(old)
+
+    def write(self, staging: pathlib.Path, tables: dict[str, pd.DataFrame]) -> None:
+        staging.mkdir(parents=True)
+        for table in ['teams', 'players']:
+            tables[table].to_parquet(staging / f'{table}.parquet', index=False)
+        for site_type in self.site_table_columns:
+            site_tables = [tables[site + site_type].assign(site=site) for site in self.sites]
+            pd.concat(site_tables, ignore_index=True).to_parquet(staging / f'site{site_type}', partition_cols=['site'], index=False)
+
+class SqlFileSink(FileSink):
+    """Creates the PostgreSQL tables, keys included, in a database file and bulk inserts every table in one transaction"""
+    base_tables = {
+        'teams': """
+            CREATE TABLE teams (
+                team_id INTEGER,
+                name VARCHAR(255),
+                PRIMARY KEY (team_id)
+            );
+        """,
+        'players': """
+            CREATE TABLE players (
+                player_id INTEGER,
+                name VARCHAR(255),
+                team_id INTEGER,
+                PRIMARY KEY (player_id),
+                FOREIGN KEY (team_id)
+                    REFERENCES teams (team_id)
+            );
+        """,
+    }
+    site_table = """
+        CREATE TABLE {table} (
+            {id_col} INTEGER,
+            {name_col} VARCHAR(255),
+            {site_id_col} VARCHAR(255),
+            site_url VARCHAR(255),
+            PRIMARY KEY ({id_col}),
+            FOREIGN KEY ({id_col})
+                REFERENCES {base_table} ({id_col})
+        );
+    """
+
+    def create_query(self, table: str) -> str:
+        if table in self.base_tables:
+            return self.base_tables[table]
+        site, site_type = table.split('_')
+        id_col, name_col, site_id_col, _ = self.site_table_columns['_' + site_type]
+        return self.site_table.format(table=table, id_col=id_col, name_col=name_col, site_id_col=site_id_col, base_table=site_type)
+
+    @abc.abstractmethod
+    def connect(self, path: pathlib.Path):
+        """Opens the database file at path in a transaction"""
+
+    @abc.abstractmethod
+    def insert_rows(self, conn, table: str, rows: pd.DataFrame) -> None:
+        """Bulk inserts the rows of a created table"""
+
+    def write(self, staging: pathlib.Path, tables: dict[str, pd.DataFrame]) -> None:
+        conn = self.connect(staging)
+        try:
+            for table, rows in tables.items():
+                conn.execute(self.create_query(table))
+                self.insert_rows(conn, table, rows)
+            conn.commit()
+        finally:
+            conn.close()
+
+class DuckDBSink(SqlFileSink):
+    """Writes the tables to a DuckDB file, inserting each straight from its dataframe in one statement"""
+    default_path = 'crosswalk.duckdb'
+
+    def connect(self, path: pathlib.Path):
+        if duckdb is None:
+            raise ImportError('DuckDBSink needs duckdb, pip install duckdb')
+        conn = duckdb.connect(str(path))
+        conn.begin()
+        return conn
+
+    def insert_rows(self, conn, table: str, rows: pd.DataFrame) -> None:
+        conn.register('rows_view', rows)
+        conn.execute(f'INSERT INTO {table} SELECT * FROM rows_view;')
+        conn.unregister('rows_view')
+
+class SQLiteSink(SqlFileSink):
+    """Writes the tables to a SQLite file with executemany, checking foreign keys"""
+    default_path = 'crosswalk.sqlite'
+
+    def connect(self, path: pathlib.Path):
+        conn = sqlite3.connect(path)
+        conn.execute('PRAGMA foreign_keys = ON;')
+        return conn
+
+    def insert_rows(self, conn, table: str, rows: pd.DataFrame) -> None:
+        values = rows.astype(object).where(rows.notna(), None).itertuples(index=False, name=None)
+        conn.executemany(f'INSERT INTO {table} VALUES ({", ".join("?" * len(rows.columns))});', values)
+
+sinks = {
+    'parquet': ParquetSink,
+    'duckdb': DuckDBSink,
+    'sqlite': SQLiteSink,
+}
@@ -1,10 +1,20 @@
 """Helpers to manage request headers for site scrapers"""
 
+from importlib.util import find_spec
+
+def accept_encoding() -> str:
+    """Lists the encodings aiohttp can decode, br only when a brotli package is installed"""
+    encodings = ['gzip', 'deflate']
+    if find_spec('brotli') or find_spec('brotlicffi'):
+        encodings.append('br')
+    return ', '.join(encodings)
+
 agent_headers = {
-    'sec-ch-ua': '" Not A;Brand";v="99", "Chromium";v="99", "Google Chrome";v="99"',
-    'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/101.0.4951.64 Safari/537.36',
+    'sec-ch-ua': '"Google Chrome";v="141", "Not?A_Brand";v="8", "Chromium";v="141"',
+    'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/141.0.0.0 Safari/537.36',
+    'accept-encoding': accept_encoding(),
 }
 
 def set_headers(agent_headers=agent_headers, **kwargs):
     """Sets headers for web scraping tasks"""
-    return agent_headers | kwargs
\ No newline at end of file
+    return agent_headers | kwargs
@@ -0,0 +1,81 @@
+"""Registry of the scraped sites, importing a site's class and scraper kind only once the site is selected
+
+A worker running only http sites never imports playwright, and the driver can scrape any subset of sites.
+"""
+
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from importlib import import_module
+
+@dataclass(frozen=True)
+class SitePlugin:
+    """A site and the scraper kind that extracts it
+
+    Keyword arguments:
+    name -- site name, as in the site class
+    site -- 'module:Class' of the site
+    scraper -- 'module:Class' of the scraper kind
+    resources -- scraper arguments after the site, taken from the resources extract_main has
+    browser_scraper -- optional scraper kind and resources used instead when the site is scraped in the browser
+    """
+    name: str
+    site: str
+    scraper: str
+    resources: tuple
+    browser_scraper: tuple = None
+
+    def scraper_kind(self, in_browser: bool) -> tuple[str, tuple]:
+        if in_browser and self.browser_scraper:
+            return self.browser_scraper
+        return self.scraper, self.resources
+
+    def needs_browser(self, in_browser: bool = False) -> bool:
+        return 'browser' in self.scraper_kind(in_browser)[1]
+
+plugins = {plugin.name: plugin for plugin in [
+    SitePlugin('sofascore', 'sites:Sofa', 'siteScrapers:AiohttpOnlyJson', ('session', 'scheduler', 'squads', 'decoder')),
+    SitePlugin('fotmob', 'sites:FotMob', 'siteScrapers:AiohttpOnlyJson', ('session', 'scheduler', 'squads', 'decoder')),
+    SitePlugin('transfermarkt', 'sites:Tm', 'siteScrapers:AiohttpOnlyHtml', ('session', 'scheduler', 'squads')),
+    SitePlugin('soccerment', 'sites:Soccerment', 'siteScrapers:AiohttpOnlyHtml', ('session', 'scheduler', 'squads')),
+    SitePlugin('understat', 'sites:Under', 'siteScrapers:AiohttpOnlyHtml', ('session', 'scheduler', 'squads'),
+               ('siteScrapers:PlaywrightOnly', ('browser', 'scheduler', 'squads'))),
+    SitePlugin('fbref', 'sites:Fbref', 'siteScrapers:AiohttpOnlyHtml', ('session', 'scheduler', 'squads'),
+               ('siteScrapers:PlaywrightOnly', ('browser', 'scheduler', 'squads'))),
+    SitePlugin('capology', 'sites:Cap', 'siteScrapers:PlaywrightOnlyCap', ('browser', 'scheduler', 'squads')),
+    SitePlugin('whoscored', 'sites:Who', 'siteScrapers:PlaywrightAiohttp', ('session', 'browser', 'scheduler', 'squads', 'decoder')),
+]}
+
+def load(path: str):
+    """Imports 'module:Class'"""
+    module_name, class_name = path.split(':')
+    return getattr(import_module(module_name), class_name)
+
+def select(site_names: list[str] = None) -> list[SitePlugin]:
+    """Gets the plugins of the named sites in registry order, every site when none are named"""
+    if site_names is None:
+        return list(plugins.values())
+    unknown = set(site_names) - set(plugins)
+    if unknown:
+        raise ValueError(f'Unknown sites {sorted(unknown)}, expected some of {list(plugins)}')
+    return [plugin for name, plugin in plugins.items() if name in site_names]
+
+def build_scraper(plugin: SitePlugin, resources: dict, browser_sites=()):
+    """Creates the site and its scraper, giving the scraper the resources it declares
+
+    Keyword arguments:
+    resources -- 'browser', 'sessions' (siteSessions.SiteSessions), 'scheduler', 'squads' and 'decoder';
+                 'session' is the site's own session from sessions
+    """
+    scraper_path, scraper_resources = plugin.scraper_kind(plugin.name in browser_sites)
+    args = [resources['sessions'].get(plugin.name) if resource == 'session' else resources[resource] for resource in scraper_resources]
+    return load(scraper_path)(load(plugin.site)(), *args)
+
+@asynccontextmanager
+async def launch_browser(selected: list[SitePlugin], browser_sites=()):
+    """Starts playwright and a browser only if a selected site is scraped in one, yielding None otherwise"""
+    if not any(plugin.needs_browser(plugin.name in browser_sites) for plugin in selected):
+        yield None
+        return
+    from playwright.async_api import async_playwright
+    async with async_playwright() as p:
+        yield await p.chromium.launch(headless=False)
@@ -1,13 +1,23 @@
-import json
+from __future__ import annotations
 import pandas as pd
 from itertools import chain
 import asyncio
-from aiohttp import ClientSession
-from playwright.async_api import Browser, Page
-from sites import Fbref, FotMob, Soccerment, Under, Who, Sofa, Tm, Cap
+from functools import partial
+from aiohttp import ClientSession, ClientResponseError
 from siteHeaders import set_headers
 from idObjects import ClubData, PlayerData
-from typing import Union
+from crawlScheduler import CrawlScheduler
+from squadCache import SquadCache
+from jsonDecoders import JsonDecoder
+from siteSessions import SiteSessions
+from buildIds import BuildIdResolver
+from sitePlugins import SitePlugin, build_scraper, select
+from metrics import metrics
+from typing import Union, TYPE_CHECKING
+
+if TYPE_CHECKING: # sites and playwright are only imported once a site plugin is selected
+    from playwright.async_api import Browser, Page
+    from sites import Fbref, FotMob, Soccerment, Under, Who, Sofa, Tm, Cap
 
 class PlaywrightOnly:
     """Facilitates scraping of sites where content is dynamically loaded
@@ -16,33 +26,52 @@ class PlaywrightOnly:
     understat
     fbref
     """
-    def __init__(self, site: Union[Under, Fbref], browser: Browser) -> None:
+    def __init__(self, site: Union[Under, Fbref], browser: Browser, scheduler: CrawlScheduler = None, squads: SquadCache = None) -> None:
         self.site = site
         self.browser = browser
+        self.scheduler = scheduler or CrawlScheduler()
+        self.squads = squads or SquadCache()
         self.context = None
 
     async def get_club_table(self, league, page: Page) -> list[ClubData]:
         league_url = self.site.get_league_url(league)
-        await page.goto(league_url)
-        await page.locator(self.site.club_table).wait_for()
-        return self.site.process_club_table(await page.inner_html(self.site.club_table))
+        with metrics.span('request', site=self.site.name, kind='league'):
+            await page.goto(league_url)
+            await page.locator(self.site.club_table).wait_for()
+            club_html = await page.inner_html(self.site.club_table)
+        with metrics.span('parse', site=self.site.name, kind='league'):
+            return self.site.process_club_table(club_html)
         
     async def get_player_table(self, club: ClubData, page: Page) -> list[PlayerData]:
-        await page.goto(club.url)
-        await page.locator(self.site.player_table).wait_for()
-        return self.site.process_player_table(await page.inner_html(self.site.player_table), club.name)
+        with metrics.span('request', site=self.site.name, kind='club'):
+            await page.goto(club.url)
+            await page.locator(self.site.player_table).wait_for()
+            player_html = await page.inner_html(self.site.player_table)
+        with metrics.span('parse', site=self.site.name, kind='club'):
+            return self.squads.parse(self.site.name, club, player_html, lambda html: self.site.process_player_table(html, club.name))
 
     def idObjects_to_df(self, idObjects: Union[list[ClubData], list[PlayerData]]) -> pd.DataFrame:
         return pd.DataFrame(map(lambda x: x.__dict__, idObjects)) 
 
+    async def on_new_page(self, scrape, *args):
+        """Runs a page scrape in its own tab of the shared context so units can run concurrently"""
+        page = await self.context.new_page()
+        try:
+            return await scrape(*args, page)
+        finally:
+            await page.close()
+
     async def main(self) -> tuple[pd.DataFrame, pd.DataFrame]:
         self.context = await self.browser.new_context()
-        page = await self.context.new_page()
-        clubs = [await self.get_club_table(league, page) for league in self.site.leagues.values()]
-        all_clubs = list(chain(*clubs))
-        club_df = self.idObjects_to_df(all_clubs)
-        players = [await self.get_player_table(club, page) for club in all_clubs]
-        await self.context.close()
+        try:
+            league_units = [(name, self.site.get_league_url(league), name, partial(self.on_new_page, self.get_club_table, league)) for name, league in self.site.leagues.items()]
+            clubs = await self.scheduler.gather(self.site.name, 'league', league_units)
+            all_clubs = list(chain(*clubs))
+            club_df = self.idObjects_to_df(all_clubs)
+            club_units = [(f'{name} {club.url}', club.url, name, partial(self.on_new_page, self.get_player_table, club)) for name, league_clubs in zip(self.site.leagues, clubs) for club in league_clubs]
+            players = await self.scheduler.gather(self.site.name, 'club', club_units)
+        finally:
+            await self.context.close()
         all_players = list(chain(*players))
         player_df = self.idObjects_to_df(all_players)
         return club_df, player_df
@@ -54,22 +83,30 @@ class PlaywrightOnlyCap:
     yet the way the data is structured has a workaround where all teams and players within a league
     are available on a single page
     """
-    def __init__(self, site: Cap, browser: Browser) -> None:
+    def __init__(self, site: Cap, browser: Browser, scheduler: CrawlScheduler = None, squads: SquadCache = None) -> None:
         self.site = site
         self.browser = browser
+        self.scheduler = scheduler or CrawlScheduler()
+        self.squads = squads or SquadCache()
         self.context = None
 
     async def get_club_table(self, league, page: Page) -> list[ClubData]:
         league_url = self.site.get_league_url(league)
-        await page.goto(league_url)
-        await page.locator(self.site.club_table).wait_for()
-        return self.site.process_club_table(await page.inner_html(self.site.club_table))
+        with metrics.span('request', site=self.site.name, kind='league'):
+            await page.goto(league_url)
+            await page.locator(self.site.club_table).wait_for()
+            club_html = await page.inner_html(self.site.club_table)
+        with metrics.span('parse', site=self.site.name, kind='league'):
+            return self.site.process_club_table(club_html)
 
     async def get_player_table(self, page: Page) -> list[PlayerData]:
-        await page.locator(self.site.player_table).first.wait_for()
-        await page.locator('a.dropdown-item:has-text("All")').first.click()
-        await page.locator('div.float-right.pagination').first.wait_for(state='hidden')
-        return self.site.process_player_table(await page.inner_html(self.site.player_table))
+        with metrics.span('request', site=self.site.name, kind='league_players'):
+            await page.locator(self.site.player_table).first.wait_for()
+            await page.locator('a.dropdown-item:has-text("All")').first.click()
+            await page.locator('div.float-right.pagination').first.wait_for(state='hidden')
+            player_html = await page.inner_html(self.site.player_table)
+        with metrics.span('parse', site=self.site.name, kind='league_players'):
+            return self.site.process_player_table(player_html)
 
     async def get_league_data(self, league, page: Page) -> tuple[list[ClubData], list[PlayerData]]:
         league_clubs = await self.get_club_table(league, page)
@@ -79,11 +116,21 @@ class PlaywrightOnlyCap:
     def idObjects_to_df(self, idObjects: Union[list[ClubData], list[PlayerData]]) -> pd.DataFrame:
         return pd.DataFrame(map(lambda x: x.__dict__, idObjects))
 
+    async def on_new_page(self, scrape, *args):
+        """Runs a page scrape in its own tab of the shared context so units can run concurrently"""
+        page = await self.context.new_page()
+        try:
+            return await scrape(*args, page)
+        finally:
+            await page.close()
+
     async def main(self) -> tuple[pd.DataFrame, pd.DataFrame]:
         self.context = await self.browser.new_context()
-        page = await self.context.new_page()
-        leagues = [await self.get_league_data(league, page) for league in self.site.leagues.values()]
-        await self.context.close()
+        try:
+            league_units = [(name, self.site.get_league_url(league), name, partial(self.on_new_page, self.get_league_data, league)) for name, league in self.site.leagues.items()]
+            leagues = await self.scheduler.gather(self.site.name, 'league', league_units, ([], []))
+        finally:
+            await self.context.close()
         clubs = map(lambda x: x[0], leagues)
         all_clubs = list(chain(*clubs))
         club_df = self.idObjects_to_df(all_clubs)
@@ -101,34 +148,57 @@ class AiohttpOnlyJson:
     transfermrkt
     fotmob
     """
-    def __init__(self, site: Union[Sofa, FotMob], session: ClientSession) -> None:
+    def __init__(self, site: Union[Sofa, FotMob], session: ClientSession, scheduler: CrawlScheduler = None, squads: SquadCache = None, decoder: JsonDecoder = None) -> None:
         self.site = site
         self.session = session
+        self.scheduler = scheduler or CrawlScheduler()
+        self.squads = squads or SquadCache()
+        self.decoder = decoder or JsonDecoder()
+        self.build_ids = BuildIdResolver(site, session) if hasattr(site, 'build_id_page') else None
 
     async def get_club_json(self, league) -> list[ClubData]:
         league_url = self.site.get_league_url(league)
-        print(league_url)
-        async with self.session.get(league_url, headers=self.site.headers) as r:
-            r.raise_for_status()
-            club_json = json.loads(await r.read())
-            return self.site.process_club_json(club_json)
+        with metrics.span('request', site=self.site.name, kind='league'):
+            _, _, club_body = await self.scheduler.hedger.get(self.session, league_url, self.site.headers, self.site.name)
+        with metrics.span('parse', site=self.site.name, kind='league'):
+            return self.site.process_club_json(self.decoder.decode(club_body, self.site.club_projection))
 
     async def get_player_json(self, club: ClubData) -> list[PlayerData]:
+        """Gets a club's players, first resolving the build ID of sites whose squad URLs carry one
+
+        A 404 is taken to mean the build ID went stale, so it's refreshed once and the request retried.
+        """
+        if self.build_ids is None:
+            return await self.request_player_json(club)
+        build_id = await self.build_ids.resolve()
+        try:
+            return await self.request_player_json(club)
+        except ClientResponseError as e:
+            if e.status != 404:
+                raise
+        await self.build_ids.refresh(build_id)
+        return await self.request_player_json(club)
+
+    async def request_player_json(self, club: ClubData) -> list[PlayerData]:
         club_api_url = self.site.club_api_url(club)
-        print(club_api_url)
-        async with self.session.get(club_api_url, headers=self.site.headers) as r:
-            r.raise_for_status()
-            player_json = json.loads(await r.read())
-            return self.site.process_player_json(player_json, club)
+        headers = self.squads.request_headers(self.site.name, club, self.site.headers)
+        with metrics.span('request', site=self.site.name, kind='club'):
+            status, response_headers, player_body = await self.scheduler.hedger.get(self.session, club_api_url, headers, self.site.name)
+        if status == 304:
+            return self.squads.not_modified(self.site.name, club)
+        with metrics.span('parse', site=self.site.name, kind='club'):
+            return self.squads.parse(self.site.name, club, player_body, lambda body: self.site.process_player_json(self.decoder.decode(body, self.site.player_projection), club), headers=response_headers)
 
     def idObjects_to_df(self, idObjects: Union[list[ClubData], list[PlayerData]]) -> pd.DataFrame:
         return pd.DataFrame(map(lambda x: x.__dict__, idObjects))
 
     async def main(self) -> tuple[pd.DataFrame, pd.DataFrame]:
-        clubs = [await self.get_club_json(league) for league in self.site.leagues.values()]
+        league_units = [(name, self.site.get_league_url(league), name, partial(self.get_club_json, league)) for name, league in self.site.leagues.items()]
+        clubs = await self.scheduler.gather(self.site.name, 'league', league_units)
         all_clubs = list(chain(*clubs))
         club_df = self.idObjects_to_df(all_clubs)
-        players = [await self.get_player_json(club) for club in all_clubs]
+        club_units = [(f'{name} {club.url}', self.site.club_api_url(club), name, partial(self.get_player_json, club)) for name, league_clubs in zip(self.site.leagues, clubs) for club in league_clubs]
+        players = await self.scheduler.gather(self.site.name, 'club', club_units)
         all_players = list(chain(*players))
         player_df = self.idObjects_to_df(all_players)
         return club_df, player_df
@@ -139,35 +209,43 @@ class AiohttpOnlyHtml:
 
     Applicable to:
     soccerment
+    transfermarkt
+    fbref and understat, unless scraped in the browser
     """
-    def __init__(self, site: Union[Soccerment, Tm], session: ClientSession) -> None:
+    def __init__(self, site: Union[Soccerment, Tm, Fbref, Under], session: ClientSession, scheduler: CrawlScheduler = None, squads: SquadCache = None) -> None:
         self.site = site
         self.session = session
+        self.scheduler = scheduler or CrawlScheduler()
+        self.squads = squads or SquadCache()
 
     async def get_club_html(self, league) -> list[ClubData]:
         league_url = self.site.get_league_url(league)
-        print(league_url)
-        async with self.session.get(league_url, headers=self.site.headers) as r:
-            r.raise_for_status()
-            club_html = await r.text()
+        with metrics.span('request', site=self.site.name, kind='league'):
+            _, _, club_html = await self.scheduler.hedger.get(self.session, league_url, self.site.headers, self.site.name, text=True)
+        with metrics.span('parse', site=self.site.name, kind='league'):
             return self.site.process_club_html(club_html)
 
     async def get_player_html(self, club: ClubData) -> list[PlayerData]:
         club_api_url = self.site.club_api_url(club)
-        print(club_api_url)
-        async with self.session.get(club_api_url, headers=self.site.headers) as r:
-            r.raise_for_status()
-            player_html = await r.text()
-            return self.site.process_player_html(player_html, club)
+        headers = self.squads.request_headers(self.site.name, club, self.site.headers)
+        with metrics.span('request', site=self.site.name, kind='club'):
+            status, response_headers, player_html = await self.scheduler.hedger.get(self.session, club_api_url, headers, self.site.name, text=True)
+        if status == 304:
+            return self.squads.not_modified(self.site.name, club)
+        with metrics.span('parse', site=self.site.name, kind='club'):
+            parse = lambda html: self.site.process_player_html(html, club)
+            return self.squads.parse(self.site.name, club, player_html, parse, self.site.squad_bounds, response_headers)
 
     def idObjects_to_df(self, idObjects: Union[list[ClubData], list[PlayerData]]) -> pd.DataFrame:
         return pd.DataFrame(map(lambda x: x.__dict__, idObjects))
 
     async def main(self) -> tuple[pd.DataFrame, pd.DataFrame]:
-        clubs = [await self.get_club_html(league) for league in self.site.leagues.values()]
+        league_units = [(name, self.site.get_league_url(league), name, partial(self.get_club_html, league)) for name, league in self.site.leagues.items()]
+        clubs = await self.scheduler.gather(self.site.name, 'league', league_units)
         all_clubs = list(chain(*clubs))
         club_df = self.idObjects_to_df(all_clubs)
-        players = [await self.get_player_html(club) for club in all_clubs]
+        club_units = [(f'{name} {club.url}', self.site.club_api_url(club), name, partial(self.get_player_html, club)) for name, league_clubs in zip(self.site.leagues, clubs) for club in league_clubs]
+        players = await self.scheduler.gather(self.site.name, 'club', club_units)
         all_players = list(chain(*players))
         player_df = self.idObjects_to_df(all_players)
         return club_df, player_df
@@ -179,10 +257,13 @@ class PlaywrightAiohttp:
     Applicable to:
     whoscored
     """
-    def __init__(self, site: Who, session: ClientSession, browser: Browser):
+    def __init__(self, site: Who, session: ClientSession, browser: Browser, scheduler: CrawlScheduler = None, squads: SquadCache = None, decoder: JsonDecoder = None):
         self.site = site
         self.session = session
         self.browser = browser
+        self.scheduler = scheduler or CrawlScheduler()
+        self.squads = squads or SquadCache()
+        self.decoder = decoder or JsonDecoder()
         self.context = None
 
     async def get_cookies(self) -> str:
@@ -200,54 +281,89 @@ class PlaywrightAiohttp:
 
     async def get_club_table(self, league, page: Page) -> list[ClubData]:
         league_url = self.site.get_league_url(league)
-        await page.goto(league_url)
-        await page.locator(self.site.club_table).wait_for()
-        return self.site.process_club_table(await page.inner_html(self.site.club_table), league)
+        with metrics.span('request', site=self.site.name, kind='league'):
+            await page.goto(league_url)
+            await page.locator(self.site.club_table).wait_for()
+            club_html = await page.inner_html(self.site.club_table)
+        with metrics.span('parse', site=self.site.name, kind='league'):
+            return self.site.process_club_table(club_html, league)
 
     async def get_player_json(self, club: ClubData) -> list[PlayerData]:
         club_api_url = self.site.club_api_url(club)
-        headers = await self.get_headers(club)
-        async with self.session.get(club_api_url, headers=headers) as r:
-            r.raise_for_status()
-            player_json = json.loads(await r.read())
-            return self.site.process_player_json(player_json, club)
+        headers = self.squads.request_headers(self.site.name, club, await self.get_headers(club))
+        with metrics.span('request', site=self.site.name, kind='club'):
+            status, response_headers, player_body = await self.scheduler.hedger.get(self.session, club_api_url, headers, self.site.name)
+        if status == 304:
+            return self.squads.not_modified(self.site.name, club)
+        with metrics.span('parse', site=self.site.name, kind='club'):
+            return self.squads.parse(self.site.name, club, player_body, lambda body: self.site.process_player_json(self.decoder.decode(body, self.site.player_projection), club), headers=response_headers)
 
     def idObjects_to_df(self, idObjects: Union[list[ClubData], list[PlayerData]]) -> pd.DataFrame:
         return pd.DataFrame(map(lambda x: x.__dict__, idObjects))
 
+    async def on_new_page(self, scrape, *args):
+        """Runs a page scrape in its own tab of the shared context so units can run concurrently"""
+        page = await self.context.new_page()
+        try:
+            return await scrape(*args, page)
+        finally:
+            await page.close()
+
     async def main(self) -> tuple[pd.DataFrame, pd.DataFrame]:
         self.context = await self.browser.new_context()
-        page = await self.context.new_page()
-        clubs = [await self.get_club_table(league, page) for league in self.site.leagues.values()]
-        all_clubs = list(chain(*clubs))
-        club_df = self.idObjects_to_df(all_clubs)
-        players = [await self.get_player_json(club) for club in all_clubs]
-        await self.context.close()
+        try:
+            league_units = [(name, self.site.get_league_url(league), name, partial(self.on_new_page, self.get_club_table, league)) for name, league in self.site.leagues.items()]
+            clubs = await self.scheduler.gather(self.site.name, 'league', league_units)
+            all_clubs = list(chain(*clubs))
+            club_df = self.idObjects_to_df(all_clubs)
+            club_units = [(f'{name} {club.url}', self.site.club_api_url(club), name, partial(self.get_player_json, club)) for name, league_clubs in zip(self.site.leagues, clubs) for club in league_clubs]
+            players = await self.scheduler.gather(self.site.name, 'club', club_units)
+        finally:
+            await self.context.close()
         all_players = list(chain(*players))
         player_df = self.idObjects_to_df(all_players)
         return club_df, player_df
 
-async def extract_main(browser: Browser, session: ClientSession) -> tuple[pd.DataFrame, pd.DataFrame]:
-    """Extracts player and team data from each site and stores them in comprehensive dataframes"""
-    site_tasks = [
-        AiohttpOnlyJson(Sofa(), session).main(),
-        AiohttpOnlyJson(FotMob(), session).main(),
-        AiohttpOnlyHtml(Tm(), session).main(),
-        AiohttpOnlyHtml(Soccerment(), session).main(),
-        PlaywrightOnly(Under(), browser).main(),
-        PlaywrightOnly(Fbref(), browser).main(),
-        PlaywrightOnlyCap(Cap(), browser).main(),
-        PlaywrightAiohttp(Who(), session, browser).main(),
-    ]
-    df_tuples = await asyncio.gather(*site_tasks)
-    all_clubs_df = pd.concat((df_tuple[0] for df_tuple in df_tuples))
-    all_players_df = pd.concat((df_tuple[1] for df_tuple in df_tuples))
+async def site_main(scraper) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Runs a site scraper within a timing span and records the number of clubs and players it found"""
+    with metrics.span('site', site=scraper.site.name):
+        club_df, player_df = await scraper.main()
+    metrics.set('rows', len(club_df), stage='extract', site=scraper.site.name, frame='club_df')
+    metrics.set('rows', len(player_df), stage='extract', site=scraper.site.name, frame='player_df')
+    return club_df, player_df
+
+async def extract_main(browser: Browser, sessions: SiteSessions, scheduler: CrawlScheduler = None, squads: SquadCache = None, decoder: JsonDecoder = None, browser_sites: tuple = (), selected: list[SitePlugin] = None) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Extracts player and team data from each site and stores them in comprehensive dataframes
+
+    Each league and club is a crawl unit run by the scheduler and recorded in its progress journal, so one
+    failed page or site doesn't sink the others. Check scheduler.journal.failures() before using the results.
+    Squads unchanged since the squad cache was last saved reuse their stored players. Each aiohttp site
+    gets its own session from sessions, with the site's transport profile. JSON responses are decoded with decoder.
+    fbref and understat are scraped over http from their raw pages unless named in browser_sites.
+    Only the selected site plugins (every site by default) are imported and scraped.
+    """
+    scheduler = scheduler or CrawlScheduler()
+    squads = squads or SquadCache()
+    journal = scheduler.journal
+    resources = {'browser': browser, 'sessions': sessions, 'scheduler': scheduler, 'squads': squads, 'decoder': decoder}
+    site_scrapers = [build_scraper(plugin, resources, browser_sites) for plugin in selected or select()]
+    for scraper in site_scrapers:
+        scraper.site.leagues = scheduler.site_leagues(scraper.site)
+    try:
+        site_results = await asyncio.gather(*(site_main(scraper) for scraper in site_scrapers), return_exceptions=True)
+    finally:
+        await scheduler.stop()
+    df_tuples = []
+    for scraper, site_result in zip(site_scrapers, site_results):
+        if isinstance(site_result, BaseException): # a cancelled site returns CancelledError, which isn't an Exception
+            journal.record_failure(journal.key(scraper.site.name, 'site', 'main'), site_result)
+        else:
+            journal.clear_failure(scraper.site.name)
+            df_tuples.append(site_result)
+    if not df_tuples:
+        return pd.DataFrame(), pd.DataFrame()
+    all_clubs_df = scheduler.keep_latest(pd.concat((df_tuple[0] for df_tuple in df_tuples)))
+    all_players_df = scheduler.keep_latest(pd.concat((df_tuple[1] for df_tuple in df_tuples)))
+    metrics.set('rows', len(all_clubs_df), stage='extract', frame='all_clubs_df')
+    metrics.set('rows', len(all_players_df), stage='extract', frame='all_players_df')
     return all_clubs_df, all_players_df
-
-        
-        
-
-        
-        
-            
-        
@@ -0,0 +1,81 @@
+"""Per site aiohttp sessions, each with a connection pool, timeouts and headers tuned to how the site is crawled"""
+
+from dataclasses import dataclass, field
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+from crawlScheduler import CrawlScheduler
+from siteHeaders import set_headers
+
+@dataclass
+class TransportProfile:
+    """Connection pool, timeouts and default headers of one site's session
+
+    Keyword arguments:
+    host -- host the site's requests go to, used to size the pool from the scheduler's host cap
+    limit -- pooled connections, None sizes the pool to the scheduler's cap for host
+    spare -- connections on top of limit, so a hedged duplicate doesn't wait behind the request it hedges
+    connect_timeout -- seconds to open a connection, not counting the wait for a free pooled one
+    read_timeout -- seconds without data before a slow response is dropped
+    total_timeout -- seconds for a whole request, including the wait for a free pooled connection; None for sessions
+                     whose requests are fired all at once and queue for the pool
+    dns_ttl -- seconds resolved addresses are cached
+    keepalive -- seconds idle connections are kept open for reuse
+    headers -- default headers added to set_headers
+    """
+    host: str = None
+    limit: int = None
+    spare: int = 1
+    connect_timeout: float = 10
+    read_timeout: float = 30
+    total_timeout: float = 60
+    dns_ttl: int = 600
+    keepalive: float = 30
+    headers: dict = field(default_factory=dict)
+
+profiles = { # sites scraped at least partly over aiohttp, plus the wikipedia lookups of player name matching
+    'sofascore': TransportProfile('api.sofascore.com', read_timeout=15, total_timeout=30, headers={'accept': 'application/json'}),
+    'fotmob': TransportProfile('www.fotmob.com', read_timeout=15, total_timeout=30, headers={'accept': 'application/json'}),
+    'transfermarkt': TransportProfile('www.transfermarkt.us', read_timeout=45, total_timeout=90),
+    'soccerment': TransportProfile('analytics.soccerment.com'),
+    'fbref': TransportProfile('www.fbref.com', read_timeout=45, total_timeout=90),
+    'understat': TransportProfile('www.understat.com'),
+    'whoscored': TransportProfile('www.whoscored.com', keepalive=15, headers={'accept': 'application/json'}),
+    'wikipedia': TransportProfile('en.wikipedia.org', limit=10, read_timeout=15, total_timeout=None, dns_ttl=3600), # lookups are gathered per club and queue for the pool
+}
+
+class SiteSessions:
+    """Opens one ClientSession per site on first use, each with its own pool so a slow host
+    can only exhaust its own connections
+
+    Pools default to the scheduler's concurrency cap for the site's host, since the scheduler never
+    has more of the host's units in flight. Use as an async context manager to close every session.
+    """
+    def __init__(self, scheduler: CrawlScheduler = None, profiles: dict = profiles) -> None:
+        self.scheduler = scheduler or CrawlScheduler()
+        self.profiles = profiles
+        self.sessions = {}
+
+    def pool_size(self, profile: TransportProfile) -> int:
+        return (profile.limit or self.scheduler.host_cap(profile.host)) + profile.spare
+
+    def create(self, profile: TransportProfile) -> ClientSession:
+        limit = self.pool_size(profile)
+        connector = TCPConnector(limit=limit, limit_per_host=limit, ttl_dns_cache=profile.dns_ttl, keepalive_timeout=profile.keepalive)
+        timeout = ClientTimeout(total=profile.total_timeout, sock_connect=profile.connect_timeout, sock_read=profile.read_timeout)
+        return ClientSession(connector=connector, timeout=timeout, headers=set_headers(**profile.headers))
+
+    def get(self, site_name: str) -> ClientSession:
+        """Gets the site's session, opening it with the site's profile (or the default profile) the first time"""
+        if site_name not in self.sessions:
+            self.sessions[site_name] = self.create(self.profiles.get(site_name, TransportProfile()))
+        return self.sessions[site_name]
+
+    async def close(self) -> None:
+        for session in self.sessions.values():
+            await session.close()
+        self.sessions = {}
+
+    async def __aenter__(self) -> 'SiteSessions':
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
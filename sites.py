@@ -1,5 +1,7 @@
 from bs4 import BeautifulSoup, SoupStrainer
 import re
+import html
+import json
 from idObjects import ClubData, PlayerData
 from siteHeaders import set_headers
 from itertools import chain
@@ -10,6 +12,7 @@ Sofascore and Fotmob data can be accessed directly through http requests
 
 class Sofa:
     name = 'sofascore'
+    seasonal_squads = False # whether club squad pages follow the season of the league page, see CrawlScheduler.site_leagues
     leagues = {
         'Premier League': (17, 37036),
         'LaLiga': (8, 37223),
@@ -21,6 +24,8 @@ class Sofa:
         origin = 'https://www.sofascore.com',
         referer = 'https://www.sofascore.com/',
     )
+    club_projection = {'standings': [{'name': None, 'rows': [{'team': {'name': None, 'id': None, 'slug': None}}]}]} # fields read by the parsers, see jsonDecoders
+    player_projection = {'players': [{'player': {'name': None, 'id': None, 'slug': None}}]}
     
     def get_league_url(self, league):
         return f'https://api.sofascore.com/api/v1/unique-tournament/{league[0]}/season/{league[1]}/standings/total'
@@ -51,6 +56,7 @@ class Sofa:
 
 class FotMob:
     name = 'fotmob'
+    seasonal_squads = False
     leagues = { # using teams that have stayed in the top division to provide season modularity, current codes reflect 21/22
         'Premier League': (9825, 47, 16390),
         'Bundesliga': (9823, 54, 16494),
@@ -59,6 +65,14 @@ class FotMob:
         'Serie A': (8564, 55, 16621),
     }
     headers = set_headers()
+    build_id = None # Next.js build ID of the squad data URLs, changes every deploy, see buildIds.BuildIdResolver
+    build_id_page = 'https://www.fotmob.com/'
+    build_id_pat = re.compile(r'"buildId":"([^"]+)"')
+    club_projection = {'table': {'all': [{'name': None, 'id': None, 'pageUrl': None}]}}
+    player_projection = {'pageProps': {'initialState': {'team': {'*': {'data': {
+        'details': {'name': None},
+        'squad': [[{'name': None, 'id': None}]], # [position, players] pairs
+    }}}}}}
 
     def get_league_url(self, league):
         return f'https://www.fotmob.com/api/historicaltable?teamId={league[0]}&tableLink=historic/{league[1]}/season/{league[2]}/table.fot'
@@ -70,9 +84,9 @@ class FotMob:
         clubs = club_json['table']['all']
         return [ClubData(c['name'], c['id'], 'League N/A', self.club_url(c['pageUrl']), self.name) for c in clubs]
 
-    def club_api_url(self, club: ClubData): # 4 digit id next to data updates every matchweek !!!
+    def club_api_url(self, club: ClubData):
         slug = re.search(r'overview/(.+)$', club.url).group(1)
-        return (f'https://www.fotmob.com/_next/data/3353/teams/{club.id}'
+        return (f'https://www.fotmob.com/_next/data/{self.build_id}/teams/{club.id}'
                 f'/squad/{slug}.json?id={club.id}&tab=overview&slug={slug}')
 
     def player_url(self, player):
@@ -94,20 +108,22 @@ Tranfermarkt and Soccerment can be scraped fully without browser automation with
 
 class Tm:
     name = 'transfermarkt'
+    seasonal_squads = True
     leagues = {
-        'Premier League': ('premier-league', 'GB1'),
-        'LaLiga': ('la-liga', 'ES1'),
-        'Ligue 1': ('ligue-1', 'FR1'),
-        'Serie A': ('serie-a', 'IT1'),
-        'Bundesliga': ('bundesliga', 'L1'),      
+        'Premier League': ('premier-league', 'GB1', 2021),
+        'LaLiga': ('la-liga', 'ES1', 2021),
+        'Ligue 1': ('ligue-1', 'FR1', 2021),
+        'Serie A': ('serie-a', 'IT1', 2021),
+        'Bundesliga': ('bundesliga', 'L1', 2021),
     }
     club_strainer = SoupStrainer('table', attrs={'class': 'items'})
+    squad_bounds = ('<table class="items"', '</tbody>') # squad table markers for change detection
     club_id_pat = re.compile(r'/verein/(\d+)/saison')
     player_id_pat = re.compile(r'/(\d+)$')
     headers = set_headers()
 
     def get_league_url(self, league):
-        return f'https://www.transfermarkt.us/{league[0]}/tabelle/wettbewerb/{league[1]}/saison_id/2021'
+        return f'https://www.transfermarkt.us/{league[0]}/tabelle/wettbewerb/{league[1]}/saison_id/{league[2]}'
 
     def club_url(self, club):
         link = club.get('href')
@@ -137,9 +153,7 @@ class Tm:
         player_td = player_tr.find_all('td')[1]
         span_check = player_td.span
         if span_check:
-            player = player_td.table.a
-            print(player)
-            return player
+            return player_td.table.a
         else:
             return player_td.a
 
@@ -150,6 +164,7 @@ class Tm:
 
 class Soccerment:
     name = 'soccerment'
+    seasonal_squads = False
     leagues = {
         'Premier League': 'premier_league',
         'LaLiga': 'la_liga',
@@ -160,6 +175,7 @@ class Soccerment:
     club_strainer = SoupStrainer('tbody', attrs={'id': 'table_container'})
     player_strainer = SoupStrainer('div', attrs={'id': 'teams_tabs_content'})
     player_teamname = SoupStrainer('h1', attrs={'class': 'team_name'})
+    squad_bounds = ('id="teams_tabs_content"', '</body>')
     player_id_pat = re.compile(r'player/(\d+)/')
     headers = set_headers()
 
@@ -195,15 +211,22 @@ class Soccerment:
         return [PlayerData(p.text, self.player_id(p), club.name, self.player_url(p), self.name) for p in players]
 
 """
-Fbref and understat require full browser automation, content loaded dynamically and requests don't appear in dev tools
+Fbref and understat render their tables in the browser, but also have an http fast path:
+fbref's tables are in the raw html (many inside html comments its scripts unwrap), and understat's pages
+embed the data its tables are rendered from as JSON.parse'd strings
 """
 
 class Fbref:
     name = 'fbref'
+    seasonal_squads = True
     club_table = 'table[id$="_overall"] > tbody'
     player_table = 'table[id^="stats_standard"] > tbody'
     club_id_pat = re.compile(r'squads/(\w+)/')
     player_id_pat = re.compile(r'players/(\w+)/')
+    club_strainer = SoupStrainer('table', id=re.compile(r'_overall$'))
+    player_strainer = SoupStrainer('table', id=re.compile(r'^stats_standard'))
+    squad_bounds = ('id="stats_standard', '</table>') # squad table markers for change detection
+    headers = set_headers()
     leagues = {
         'Premier League': (9, 'Premier-League'),
         'LaLiga': (12, 'La-Liga'),
@@ -241,12 +264,31 @@ class Fbref:
         players = [row.th.a for row in trs if row.th.a]
         return [PlayerData(p.text, self.player_id(p), team_name, self.player_url(p), self.name) for p in players]
 
+    def table_body(self, page_html, strainer):
+        """Gets the inner html of a table's tbody from a raw page, unwrapping the html comments tables are hidden in"""
+        page_html = page_html.replace('<!--', '').replace('-->', '')
+        return BeautifulSoup(page_html, 'lxml', parse_only=strainer).tbody.decode_contents()
+
+    def process_club_html(self, club_html):
+        return self.process_club_table(self.table_body(club_html, self.club_strainer))
+
+    def club_api_url(self, club: ClubData):
+        return club.url
+
+    def process_player_html(self, player_html, club: ClubData):
+        return self.process_player_table(self.table_body(player_html, self.player_strainer), club.name)
+
 class Under:
     name = 'understat'
+    seasonal_squads = True
     club_table = 'div#league-chemp > table > tbody'
     player_table = '#team-players > table > tbody:not(.table-total)'
     club_id_pat = re.compile(r'team/(.+)/\d{4}')
     player_id_pat = re.compile(r'/(\d+)$')
+    js_data_pat = re.compile(r"var\s+(\w+)\s*=\s*JSON\.parse\('(.*?)'\)")
+    js_escape_pat = re.compile(r'\\(x[0-9A-Fa-f]{2}|u[0-9A-Fa-f]{4}|.)')
+    squad_bounds = ('var playersData', "')") # squad data markers for change detection
+    headers = set_headers()
     leagues = {
         'Premier League': 'EPL',
         'LaLiga': 'La_liga',
@@ -284,6 +326,35 @@ class Under:
         players = map(lambda x: x.find_all('td')[1].a, trs)
         return [PlayerData(p.text, self.player_id(p), team_name, self.player_url(p), self.name) for p in players]
 
+    def js_unescape(self, match):
+        escape = match.group(1)
+        return chr(int(escape[1:], 16)) if len(escape) > 1 else escape
+
+    def embedded_json(self, page_html, var):
+        """Decodes a variable the page's scripts build with JSON.parse('<escaped JSON>')"""
+        for name, data in self.js_data_pat.findall(page_html):
+            if name == var:
+                return json.loads(self.js_escape_pat.sub(self.js_unescape, data))
+        raise ValueError(f'no {var} in page')
+
+    def season(self, team):
+        """Gets the year a team's season started in from the date of its first match"""
+        first_match = min(match['date'] for match in team['history'])
+        year, month = int(first_match[:4]), int(first_match[5:7])
+        return year if month >= 7 else year - 1
+
+    def process_club_html(self, club_html):
+        teams = self.embedded_json(club_html, 'teamsData').values()
+        links = [(html.unescape(t['title']), f"team/{html.unescape(t['title']).replace(' ', '_')}/{self.season(t)}") for t in teams]
+        return [ClubData(title, self.club_id_pat.search(link).group(1), 'League N/A', f'https://www.understat.com/{link}', self.name) for title, link in links]
+
+    def club_api_url(self, club: ClubData):
+        return club.url
+
+    def process_player_html(self, player_html, club: ClubData):
+        players = self.embedded_json(player_html, 'playersData')
+        return [PlayerData(html.unescape(p['player_name']), str(p['id']), club.name, f"https://www.understat.com/player/{p['id']}", self.name) for p in players]
+
 """
 Capology requires browser automation but has different data structure to that of other sites
 as you are able to extract all the player and team data for a given league from one page
@@ -291,6 +362,7 @@ as you are able to extract all the player and team data for a given league from
 
 class Cap:
     name = 'capology'
+    seasonal_squads = True
     club_table = '#panel > div.content-block > div > div.col.s12.team-row-container > div.col.s12.team-row'
     player_table = '#table > tbody'
     club_id_pat = re.compile(r'/club/(.+)/salaries/')
@@ -303,8 +375,9 @@ class Cap:
         'Bundesliga': ('de', '1-bundesliga'),
     }
 
-    def get_league_url(self, league):
-        return f'https://www.capology.com/{league[0]}/{league[1]}/salaries/'
+    def get_league_url(self, league): # optional third item is a past season, e.g. '2021-2022'
+        season = f'{league[2]}/' if len(league) > 2 else ''
+        return f'https://www.capology.com/{league[0]}/{league[1]}/salaries/{season}'
 
     def club_id(self, club):
         return self.club_id_pat.search(club.get('href')).group(1)
@@ -341,10 +414,12 @@ whoscored requires extracting cookie headers through browser automation before m
 
 class Who:
     name = 'whoscored'
+    seasonal_squads = False
     club_table = 'tbody.standings'
     club_id_pat = re.compile(r'/Teams/(\d+)/')
     cookie_filter = ['ct', '_qca', '_ga', '_xpid', '_xpkey', '_gid', '_fbp']
     cookie_keyword = 'incap'
+    player_projection = {'playerTableStats': [{'name': None, 'playerId': None}]}
     leagues = {
         'Premier League': (252, 2, 'England-Premier-League'),
         'LaLiga': (206, 4, 'Spain-LaLiga'),
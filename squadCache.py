@@ -0,0 +1,107 @@
+"""Squad fingerprints kept between runs so unchanged clubs skip fetching, parsing and name matching"""
+
+import hashlib
+import json
+import os
+import pathlib
+from dataclasses import asdict
+import pandas as pd
+from idObjects import ClubData, PlayerData
+from metrics import metrics
+
+class SquadCache:
+    """Stores a fingerprint, HTTP validators and the parsed players of every (site, club) squad,
+    plus the name match rows of every team
+
+    Squad requests carry If-None-Match/If-Modified-Since when the last response had an ETag or Last-Modified,
+    so a 304 reuses the stored players without a body. Otherwise the squad table is hashed and, if unchanged,
+    reused without parsing. Teams whose players are unchanged on every site reuse their stored match rows.
+    Without a path nothing is stored between runs.
+    """
+    def __init__(self, path: pathlib.Path = None) -> None:
+        self.path = pathlib.Path(path) if path else None
+        self.squads = {}
+        self.matches = {}
+        if self.path and self.path.exists():
+            with open(self.path) as f:
+                saved = json.load(f)
+            self.squads = saved['squads']
+            self.matches = saved['matches']
+
+    def key(self, site: str, club: ClubData) -> str:
+        return f'{site}|{club.url}'
+
+    def fingerprint(self, body, bounds: tuple = None) -> str:
+        """Hashes a response, or only the part between a pair of markers when the site gives them"""
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        if bounds:
+            start = body.find(bounds[0].encode())
+            end = body.find(bounds[1].encode(), start) if start != -1 else -1
+            if end != -1:
+                body = body[start:end]
+        return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+    def request_headers(self, site: str, club: ClubData, headers: dict = None) -> dict:
+        """Adds conditional request headers from the last stored response of the squad"""
+        headers = dict(headers or {})
+        entry = self.squads.get(self.key(site, club))
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def stored_players(self, site: str, club: ClubData, reason: str) -> list[PlayerData]:
+        metrics.inc('squads_reused', site=site, reason=reason)
+        return [PlayerData(**player) for player in self.squads[self.key(site, club)]['players']]
+
+    def not_modified(self, site: str, club: ClubData) -> list[PlayerData]:
+        """Reuses the stored players after a 304 response"""
+        return self.stored_players(site, club, 'not_modified')
+
+    def parse(self, site: str, club: ClubData, body, parse, bounds: tuple = None, headers=None) -> list[PlayerData]:
+        """Reuses the stored players when the squad fingerprint is unchanged, otherwise parses and stores them
+
+        Keyword arguments:
+        parse -- function of the body returning the squad's PlayerData
+        bounds -- start and end markers around the squad table in the body
+        headers -- response headers to keep ETag and Last-Modified from
+        """
+        key = self.key(site, club)
+        fingerprint = self.fingerprint(body, bounds)
+        if self.squads.get(key, {}).get('fingerprint') == fingerprint:
+            return self.stored_players(site, club, 'fingerprint')
+        players = parse(body)
+        headers = headers or {}
+        self.squads[key] = {
+            'fingerprint': fingerprint,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'players': [asdict(player) for player in players],
+        }
+        metrics.inc('squads_parsed', site=site)
+        return players
+
+    def team_fingerprint(self, team: str, players_by_site: list) -> str:
+        return self.fingerprint(json.dumps([team, [list(players) for players in players_by_site]]))
+
+    def match_rows(self, team: str, fingerprint: str) -> pd.DataFrame:
+        """Gets the stored match rows of a team whose players are unchanged on every site, otherwise None"""
+        entry = self.matches.get(team)
+        if entry is None or entry['fingerprint'] != fingerprint:
+            return None
+        metrics.inc('squads_reused', site='all', reason='match_rows')
+        return pd.DataFrame(entry['rows'])
+
+    def store_match_rows(self, team: str, fingerprint: str, match_df: pd.DataFrame) -> None:
+        self.matches[team] = {'fingerprint': fingerprint, 'rows': match_df.to_dict('records')}
+
+    def save(self) -> None:
+        """Writes the cache atomically, so a crash mid-write keeps the previous cache"""
+        if self.path is None:
+            return
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'squads': self.squads, 'matches': self.matches}, f)
+        os.replace(tmp_path, self.path)
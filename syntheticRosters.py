@@ -0,0 +1,139 @@
+"""Synthetic multi-site rosters with known ground truth for benchmarking the name matching engine"""
+
+import random
+import pandas as pd
+from unidecode import unidecode
+from idObjects import ClubData, PlayerData
+
+first_names = [
+    'José', 'João', 'Luis', 'Sergio', 'Rúben', 'Bernardo', 'Marco', 'Thomas', 'Kai', 'Jonas', 'Ilkay', 'Hakan',
+    'Martin', 'Mateo', 'Nicolás', 'Ángel', 'Darwin', 'Kylian', 'Ousmane', 'Théo', 'Raphaël', 'Aurélien', 'Dušan',
+    'Luka', 'Mohamed', 'Sadio', 'Son', 'Takehiro', 'Kieran', 'Jack', 'Harry', 'Bukayo', 'Declan', 'Mason', 'Phil',
+    'Virgil', 'Frenkie', 'Matthijs', 'Christian', 'Kasper', 'Erling', 'Martin', 'Joško', 'Wojciech', 'Robert',
+    'Gonçalo', 'Diogo', 'Rafael', 'Federico', 'Nicolò', 'Lautaro', 'Achraf', 'Youssef', 'Kalidou', 'Serge',
+]
+last_names = [
+    'García', 'Fernández', 'Rodríguez', 'Hernández', 'Martínez', 'Müller', 'Schäfer', 'Gündoğan', 'Çalhanoğlu',
+    'Ødegaard', 'Mbappé', 'Dembélé', 'Hernández', 'Varane', 'Tchouaméni', 'Vlahović', 'Modrić', 'Salah', 'Mané',
+    'Tomiyasu', 'Tierney', 'Grealish', 'Kane', 'Saka', 'Rice', 'Mount', 'Foden', 'van Dijk', 'de Jong', 'de Ligt',
+    'Eriksen', 'Schmeichel', 'Haaland', 'Gvardiol', 'Szczęsny', 'Lewandowski', 'Ramos', 'Dalot', 'Leão', 'Chiesa',
+    'Barella', 'Martínez', 'Hakimi', 'En-Nesyri', 'Koulibaly', 'Gnabry', 'Silva', 'Santos', 'Pereira', 'Costa',
+]
+middle_names = ['Miguel', 'Carlos', 'Antonio', 'Paixão', 'Júnior', 'Andrés', 'Pablo', 'Filipe', 'Henrique']
+club_places = [
+    'Northbury', 'Westhaven', 'Eastmoor', 'Southvale', 'Kingsford', 'Ashby', 'Redcliffe', 'Blackmere', 'Stonebridge',
+    'Oakham', 'Riverton', 'Elmsworth', 'Valmora', 'San Teodoro', 'Montaigu', 'Castelverde', 'Neustadt', 'Lindenfeld',
+    'Bergheim', 'Saint-Amand', 'Porto Alegre', 'Villaviña', 'Almería Nueva', 'Fortuna', 'Borgo Reale',
+]
+club_suffixes = ['United', 'City', 'Athletic', 'Rovers', 'Wanderers', 'Albion', 'Town', 'Sporting', 'Real', 'Olympique']
+sites = ['transfermarkt', 'sofascore', 'fbref', 'understat', 'whoscored', 'soccerment', 'capology', 'fotmob']
+ascii_sites = {'understat', 'whoscored', 'soccerment', 'capology'}
+nickname_rates = {
+    'transfermarkt': 0.6, 'sofascore': 0.8, 'fbref': 0.3, 'understat': 0.7,
+    'whoscored': 0.8, 'soccerment': 0.5, 'capology': 0.2, 'fotmob': 0.9,
+}
+
+class RosterGenerator:
+    """Generates club and player dataframes shaped like extract_main output, plus the true identity of every row
+
+    Rosters include accented names that some sites strip, players listed by nickname on some sites and by full
+    name on others, teammates sharing surnames, identical names at different clubs, players missing from some
+    sites and players still listed at their previous club on some sites (transfers).
+    """
+    def __init__(self, leagues: int = 1, clubs_per_league: int = 1, players_per_club: int = 25, seed: int = 0,
+                 missing_rate: float = 0.03, transfer_rate: float = 0.02, duplicate_rate: float = 0.02, shared_surname_rate: float = 0.1) -> None:
+        self.leagues = leagues
+        self.clubs_per_league = clubs_per_league
+        self.players_per_club = players_per_club
+        self.missing_rate = missing_rate
+        self.transfer_rate = transfer_rate
+        self.duplicate_rate = duplicate_rate
+        self.shared_surname_rate = shared_surname_rate
+        self.rng = random.Random(seed)
+        self.site_ids = {site: 0 for site in sites}
+        self.club_names_used = {site: set() for site in sites}
+
+    def site_id(self, site: str):
+        """Creates an ID shaped like the given site's IDs"""
+        self.site_ids[site] += 1
+        n = self.site_ids[site]
+        if site == 'fbref':
+            return f'{self.rng.getrandbits(32):08x}'
+        if site == 'capology':
+            return f'player-{n}'
+        return n
+
+    def club_names(self, club_index: int) -> dict[str, str]:
+        """Creates a club name and the variant each site lists it under"""
+        place = club_places[club_index % len(club_places)]
+        base = f'{place} {club_suffixes[(club_index // len(club_places)) % len(club_suffixes)]}'
+        if club_index >= len(club_places) * len(club_suffixes):
+            base = f'{base} {club_index // (len(club_places) * len(club_suffixes)) + 1}'
+        variants = [base, base + ' FC', base.replace('United', 'Utd').replace('Athletic', 'Athl.'), place, 'FC ' + base]
+        names = {site: self.rng.choice(variants) for site in sites}
+        names['sofascore'] = base
+        for site, name in names.items(): # a site never lists two clubs under one name
+            if name in self.club_names_used[site]:
+                names[site] = base
+            self.club_names_used[site].add(names[site])
+        return {site: unidecode(name) if site in ascii_sites else name for site, name in names.items()}
+
+    def person(self, shared_surname: str = None) -> dict:
+        """Creates a player's full name and optional nickname"""
+        first = self.rng.choice(first_names)
+        last = shared_surname or self.rng.choice(last_names)
+        full = f'{first} {self.rng.choice(middle_names)} {last}' if self.rng.random() < 0.25 else f'{first} {last}'
+        nickname = None
+        if self.rng.random() < 0.15:
+            nickname = self.rng.choice([first, first[:4] + 'i', f'{first} Júnior'])
+        return {'full': full, 'nickname': nickname}
+
+    def site_name(self, person: dict, site: str) -> str:
+        """Chooses how a site lists a player"""
+        name = person['nickname'] if person['nickname'] and self.rng.random() < nickname_rates[site] else person['full']
+        return unidecode(name) if site in ascii_sites else name
+
+    def squad(self, club_key: str, all_people: list[dict]) -> list[dict]:
+        """Creates a club's players, some sharing a surname and some copying a name from another club"""
+        people = []
+        surnames = []
+        for i in range(self.players_per_club):
+            if all_people and self.rng.random() < self.duplicate_rate:
+                person = dict(self.rng.choice(all_people))
+            else:
+                shared = self.rng.choice(surnames) if surnames and self.rng.random() < self.shared_surname_rate else None
+                person = self.person(shared)
+            surnames.append(person['full'].split()[-1])
+            person['key'] = f'{club_key}-p{i}'
+            person['club'] = club_key
+            people.append(person)
+        return people
+
+    def generate(self) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        """Generates (club_df, player_df, truth_df), where truth_df maps each (site, id) to its true player or club key"""
+        clubs, players, truth = [], [], []
+        club_sites = {}
+        all_people = []
+        for league_index in range(self.leagues):
+            league = f'League {league_index + 1}'
+            for club_index in range(self.clubs_per_league):
+                club_key = f'c{league_index * self.clubs_per_league + club_index}'
+                names = self.club_names(league_index * self.clubs_per_league + club_index)
+                club_sites[club_key] = names
+                for site in sites:
+                    club_id = self.site_id(site)
+                    clubs.append(ClubData(names[site], club_id, league, f'https://{site}.test/club/{club_id}', site))
+                    truth.append({'kind': 'club', 'site': site, 'id': club_id, 'key': club_key})
+                all_people.extend(self.squad(club_key, all_people))
+        club_keys = list(club_sites)
+        for person in all_people:
+            transferred_from = self.rng.choice(club_keys) if len(club_keys) > 1 and self.rng.random() < self.transfer_rate else None
+            for site in sites:
+                if site != 'fotmob' and self.rng.random() < self.missing_rate:
+                    continue
+                club_key = transferred_from if transferred_from and self.rng.random() < 0.5 else person['club']
+                player_id = self.site_id(site)
+                players.append(PlayerData(self.site_name(person, site), player_id, club_sites[club_key][site], f'https://{site}.test/player/{player_id}', site))
+                truth.append({'kind': 'player', 'site': site, 'id': player_id, 'key': person['key']})
+        to_df = lambda records: pd.DataFrame(map(lambda x: x.__dict__, records))
+        return to_df(clubs), to_df(players), pd.DataFrame(truth)